@@ -0,0 +1,20 @@
+from django.contrib import admin
+
+from .models import Job
+
+
+class JobAdmin(admin.ModelAdmin):
+    list_display = (
+        'pk',
+        'name',
+        'status',
+        'priority',
+        'attempts',
+        'run_at',
+        'worker',
+    )
+    list_filter = ('status', 'name')
+    readonly_fields = ('locked_at', 'worker', 'error', 'created')
+
+
+admin.site.register(Job, JobAdmin)
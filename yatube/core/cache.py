@@ -0,0 +1,264 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    expires REAL,
+    accessed REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS cache_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO cache_stats (id, size) VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS cache_inserted AFTER INSERT ON cache BEGIN
+    UPDATE cache_stats SET size = size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_deleted AFTER DELETE ON cache BEGIN
+    UPDATE cache_stats SET size = size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS cache_updated AFTER UPDATE OF size ON cache BEGIN
+    UPDATE cache_stats SET size = size - OLD.size + NEW.size;
+END;
+"""
+UPSERT = (
+    'INSERT INTO cache (key, value, expires, accessed, size) '
+    'VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+    'expires = excluded.expires, accessed = excluded.accessed, '
+    'size = excluded.size'
+)
+ALIVE = '(expires IS NULL OR expires > ?)'
+# При переполнении кеш ужимается до этой доли MAX_BYTES, чтобы не
+# вытеснять записи на каждом set.
+CULL_TARGET = 0.9
+# SQLite ограничивает число параметров одного запроса.
+CHUNK_SIZE = 500
+
+
+class SQLiteCache(BaseCache):
+    """Кеш в файле SQLite, общий для всех процессов на одном сервере.
+
+    Файл открывается в режиме WAL, поэтому чтения не блокируют запись.
+    Объём ограничен OPTIONS['MAX_BYTES']: при переполнении вытесняются
+    давно не читавшиеся записи. Время последнего чтения обновляется не
+    чаще раза в OPTIONS['ACCESS_RESOLUTION'] секунд, чтобы не писать в
+    файл на каждый get.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.location = location
+        self.max_bytes = int(options.get('MAX_BYTES', 64 * 1024 * 1024))
+        self.access_resolution = float(options.get('ACCESS_RESOLUTION', 1))
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # После fork соединение родителя использовать нельзя.
+        if getattr(self._local, 'pid', None) != os.getpid():
+            directory = os.path.dirname(self.location)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self.location, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return self._local.connection
+
+    def _transaction(self):
+        return _Transaction(self._connection)
+
+    @staticmethod
+    def _encode(value):
+        # Целые числа хранятся как есть, чтобы incr выполнялся одним UPDATE.
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _row(self, key, value, expires, now):
+        encoded = self._encode(value)
+        size = len(key) + (8 if isinstance(encoded, int) else len(encoded))
+        return key, encoded, expires, now, size
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version=version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        made = {self._key(key, version): key for key in keys}
+        now = time.time()
+        found = {}
+        touched = []
+        connection = self._connection
+        names = list(made)
+        for start in range(0, len(names), CHUNK_SIZE):
+            chunk = names[start:start + CHUNK_SIZE]
+            rows = connection.execute(
+                f'SELECT key, value, accessed FROM cache '
+                f'WHERE key IN ({", ".join("?" * len(chunk))}) AND {ALIVE}',
+                [*chunk, now],
+            )
+            for name, value, accessed in rows:
+                found[made[name]] = self._decode(value)
+                if accessed < now - self.access_resolution:
+                    touched.append((now, name))
+        if touched:
+            with self._transaction() as connection:
+                connection.executemany(
+                    'UPDATE cache SET accessed = ? WHERE key = ?', touched
+                )
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout=timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            self._row(self._key(key, version), value, expires, now)
+            for key, value in data.items()
+        ]
+        with self._transaction() as connection:
+            connection.executemany(UPSERT, rows)
+        self._cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        row = self._row(self._key(key, version), value, expires, now)
+        with self._transaction() as connection:
+            connection.execute(
+                f'DELETE FROM cache WHERE key = ? AND NOT {ALIVE}',
+                (row[0], now),
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache '
+                '(key, value, expires, accessed, size) '
+                'VALUES (?, ?, ?, ?, ?)',
+                row,
+            ).rowcount
+        self._cull()
+        return bool(added)
+
+    def incr(self, key, delta=1, version=None):
+        name = self._key(key, version)
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                f'UPDATE cache SET value = value + ? WHERE key = ? '
+                f"AND typeof(value) = 'integer' AND {ALIVE}",
+                (delta, name, now),
+            )
+            row = connection.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {ALIVE}',
+                (name, now),
+            ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        if not isinstance(row[0], int):
+            raise TypeError(f"Value of key '{key}' is not an integer")
+        return row[0]
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        now = time.time()
+        expires = self.get_backend_timeout(timeout)
+        with self._transaction() as connection:
+            changed = connection.execute(
+                f'UPDATE cache SET expires = ? WHERE key = ? AND {ALIVE}',
+                (expires, self._key(key, version), now),
+            ).rowcount
+        return bool(changed)
+
+    def has_key(self, key, version=None):
+        row = self._connection.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+            (self._key(key, version), time.time()),
+        ).fetchone()
+        return row is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        names = [self._key(key, version) for key in keys]
+        with self._transaction() as connection:
+            for start in range(0, len(names), CHUNK_SIZE):
+                chunk = names[start:start + CHUNK_SIZE]
+                connection.execute(
+                    f'DELETE FROM cache '
+                    f'WHERE key IN ({", ".join("?" * len(chunk))})',
+                    chunk,
+                )
+
+    def clear(self):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def _size(self, connection):
+        return connection.execute(
+            'SELECT size FROM cache_stats WHERE id = 0'
+        ).fetchone()[0]
+
+    def _cull(self):
+        """Удаляет просроченные, затем давно не читавшиеся записи."""
+        if self._size(self._connection) <= self.max_bytes:
+            return
+        with self._transaction() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+            )
+            excess = self._size(connection) - self.max_bytes * CULL_TARGET
+            victims = []
+            rows = connection.execute(
+                'SELECT key, size FROM cache ORDER BY accessed'
+            )
+            for key, size in rows:
+                if excess <= 0:
+                    break
+                victims.append((key,))
+                excess -= size
+            connection.executemany('DELETE FROM cache WHERE key = ?', victims)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE сразу берёт блокировку записи, поэтому
+    чтение и изменение внутри транзакции атомарны между процессами."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute('BEGIN IMMEDIATE')
+        return self.connection
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,207 @@
+import hashlib
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache as default_cache
+from django.core.cache import caches
+from django.db import connection
+from django.utils.cache import (
+    get_cache_key,
+    has_vary_header,
+    learn_cache_key,
+    patch_response_headers,
+)
+from django.views.decorators.http import condition
+
+from .metrics import CACHE_REQUESTS
+from .stampede import get_or_refresh, store
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    """Представление выполнило больше SQL-запросов, чем ему разрешено."""
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def query_budget(limit):
+    """Ограничивает число SQL-запросов, выполняемых представлением.
+
+    При превышении пишет предупреждение в лог, а при включённой
+    настройке QUERY_BUDGET_RAISE выбрасывает QueryBudgetExceeded.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            counter = QueryCounter()
+            with connection.execute_wrapper(counter):
+                response = view(request, *args, **kwargs)
+            if counter.count > limit:
+                message = (
+                    f'{view.__module__}.{view.__name__} выполнило '
+                    f'{counter.count} SQL-запросов при бюджете {limit} '
+                    f'({request.get_full_path()})'
+                )
+                if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                    raise QueryBudgetExceeded(message)
+                logger.warning(message)
+            return response
+
+        wrapper.query_budget = limit
+        return wrapper
+
+    return decorator
+
+
+def _render(response):
+    if hasattr(response, 'render') and not response.is_rendered:
+        response.render()
+    return response
+
+
+def _cacheable(request, response):
+    """Те же правила, что у UpdateCacheMiddleware."""
+    if response.streaming or response.status_code != 200:
+        return False
+    if 'private' in response.get('Cache-Control', ()):
+        return False
+    return not (
+        not request.COOKIES
+        and response.cookies
+        and has_vary_header(response, 'Cookie')
+    )
+
+
+def _counted_get_or_refresh(name, key, compute, timeout, **kwargs):
+    """get_or_refresh, учитывающий попадания в метрике CACHE_REQUESTS."""
+    computed = False
+
+    def counted():
+        nonlocal computed
+        computed = True
+        return compute()
+
+    value = get_or_refresh(key, counted, timeout, **kwargs)
+    CACHE_REQUESTS.inc(cache=name, result='miss' if computed else 'hit')
+    return value
+
+
+def cache_page(timeout, *, cache=None, key_prefix=None):
+    """Замена django.views.decorators.cache.cache_page без stampede.
+
+    Ключи и заголовки те же, что у cache_page, но по истечении записи
+    страницу пересчитывает один запрос, а остальные получают устаревшую
+    копию (см. core.stampede.get_or_refresh).
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            cache_backend = caches[cache] if cache else default_cache
+            prefix = key_prefix
+            if prefix is None:
+                prefix = settings.CACHE_MIDDLEWARE_KEY_PREFIX
+
+            def compute():
+                response = _render(view(request, *args, **kwargs))
+                if _cacheable(request, response):
+                    patch_response_headers(response, timeout)
+                    learn_cache_key(
+                        request, response, timeout, prefix, cache_backend
+                    )
+                return response
+
+            key = get_cache_key(request, prefix, 'GET', cache_backend)
+            if key is None:
+                # Набор заголовков Vary ещё не известен — первый запрос.
+                response = compute()
+                if _cacheable(request, response):
+                    key = get_cache_key(request, prefix, 'GET', cache_backend)
+                    store(key, response, timeout, cache=cache_backend)
+                return response
+            return _counted_get_or_refresh(
+                prefix or 'cache_page',
+                key,
+                compute,
+                timeout,
+                cache=cache_backend,
+                cacheable=lambda response: _cacheable(request, response),
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def anonymous_cache_page(timeout, key_prefix, vary_on=None, version=None):
+    """Кеширует страницу для анонимных посетителей — одна запись на всех.
+
+    В отличие от cache_page ключ не зависит от cookie, поэтому запись
+    общая для всех анонимов. vary_on(request) возвращает часть ключа,
+    по умолчанию — строку запроса. version(request) — версия
+    содержимого: после её смены страница пересчитывается, а пока
+    пересчёт идёт, остальные запросы получают страницу прошлой версии.
+    Авторизованные пользователи получают страницу из представления без
+    кеширования. Пересчёт защищён от stampede так же, как в cache_page.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                request.method not in ('GET', 'HEAD')
+                or request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+            vary = vary_on(request) if vary_on else request.GET.urlencode()
+            digest = hashlib.md5(f'{request.path}?{vary}'.encode()).hexdigest()
+            key = stale_key = f'{key_prefix}:anonymous:{digest}'
+            if version:
+                key = f'{stale_key}:{version(request)}'
+            return _counted_get_or_refresh(
+                key_prefix,
+                key,
+                lambda: _render(view(request, *args, **kwargs)),
+                timeout,
+                cacheable=lambda response: (
+                    _cacheable(request, response) and not response.cookies
+                ),
+                stale_key=stale_key if version else None,
+            )
+
+        return wrapper
+
+    return decorator
+
+
+def conditional(state):
+    """Условный GET по ETag без вызова представления.
+
+    state(request, *args, **kwargs) возвращает версию страницы или None,
+    если объекта нет, — тогда представление вызывается как обычно. В
+    ETag, кроме версии, входят пользователь (страницы для него свои) и
+    строка запроса. Last-Modified не отдаётся: удаления, подписки и
+    пользователь меняют страницу, не сдвигая никакого времени, и
+    If-Modified-Since получал бы устаревший 304.
+    """
+
+    def etag(request, *args, **kwargs):
+        version = state(request, *args, **kwargs)
+        if version is None:
+            return None
+        version = f'{version}|{request.user.pk}|{request.GET.urlencode()}'
+        return hashlib.md5(version.encode()).hexdigest()
+
+    return condition(etag_func=etag)
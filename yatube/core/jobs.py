@@ -0,0 +1,160 @@
+import json
+import logging
+import traceback
+from datetime import timedelta
+from functools import update_wrapper
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Задача, которую воркер не завершил за это время, считается брошенной
+# (воркер упал) и выдаётся снова.
+LOCK_TIMEOUT = 10 * 60
+# Повтор после ошибки откладывается на RETRY_DELAY * 2 ** (попытка - 1)
+# секунд.
+RETRY_DELAY = 10
+
+
+class Task:
+    """Функция, которую можно выполнить в фоне через task.enqueue()."""
+
+    def __init__(self, func, priority=0, max_attempts=3):
+        update_wrapper(self, func)
+        self.func = func
+        self.name = f'{func.__module__}.{func.__qualname__}'
+        self.priority = priority
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args):
+        return self.func(*args)
+
+    def job(self, args, key=None, priority=None, delay=0):
+        """Несохранённая задача с аргументами args (см. enqueue)."""
+        return Job(
+            name=self.name,
+            args=json.dumps(args, ensure_ascii=False),
+            key=key,
+            priority=self.priority if priority is None else priority,
+            max_attempts=self.max_attempts,
+            run_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    def enqueue(self, *args, key=None, priority=None, delay=0):
+        """Ставит задачу в очередь и возвращает её Job.
+
+        Аргументы должны сериализоваться в JSON. Если задача с тем же
+        key ещё в очереди или выполняется, новая не ставится и
+        возвращается None.
+        """
+        job = self.job(args, key, priority, delay)
+        if key is None:
+            job.save()
+            return job
+        try:
+            with transaction.atomic():
+                job.save()
+        except IntegrityError:
+            return None
+        return job
+
+
+def enqueue_many(jobs):
+    """Ставит задачи из Task.job() в очередь одним запросом.
+
+    Задачи с ключами, которые уже в очереди, пропускаются.
+    """
+    Job.objects.bulk_create(jobs, ignore_conflicts=True)
+
+
+def pending(keys):
+    """Ключи из keys, задачи с которыми ещё в очереди или выполняются.
+
+    Одно чтение по уникальному индексу вместо попытки вставки, которая
+    открывает пишущую транзакцию и откатывается на дубликате ключа.
+    """
+    return set(Job.objects.filter(key__in=keys).values_list('key', flat=True))
+
+
+def task(func=None, *, priority=0, max_attempts=3):
+    """Декоратор фоновой задачи.
+
+    Имя задачи — путь к функции, по нему воркер её и импортирует, поэтому
+    задача должна быть доступна как атрибут модуля.
+    """
+    if func is None:
+        return lambda func: Task(func, priority, max_attempts)
+    return Task(func, priority, max_attempts)
+
+
+def claim(worker):
+    """Берёт в работу срочную задачу с наибольшим приоритетом.
+
+    Задача отмечается условным UPDATE: если её успел взять другой
+    воркер, берётся следующая.
+    """
+    while True:
+        now = timezone.now()
+        job = (
+            Job.objects.filter(
+                Q(status=Job.QUEUED, run_at__lte=now)
+                | Q(
+                    status=Job.RUNNING,
+                    locked_at__lt=now - timedelta(seconds=LOCK_TIMEOUT),
+                )
+            )
+            .order_by('-priority', 'run_at', 'pk')
+            .first()
+        )
+        if job is None:
+            return None
+        claimed = Job.objects.filter(
+            pk=job.pk, status=job.status, locked_at=job.locked_at
+        ).update(
+            status=Job.RUNNING,
+            locked_at=now,
+            worker=worker,
+            attempts=F('attempts') + 1,
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def run(job):
+    """Выполняет взятую задачу.
+
+    Выполненная задача удаляется. После ошибки задача возвращается в
+    очередь с растущей задержкой, а после max_attempts попыток остаётся
+    с состоянием FAILED и освобождает ключ.
+    """
+    if job.attempts > job.max_attempts:
+        # Задачу брали уже больше раз, чем разрешено: воркеры падали,
+        # не дойдя до конца.
+        Job.objects.filter(pk=job.pk).update(
+            status=Job.FAILED, key=None, error='Воркер не завершил задачу.'
+        )
+        return False
+    try:
+        import_string(job.name).func(*json.loads(job.args))
+    except Exception:
+        logger.exception('Задача %s не выполнена', job)
+        failed = job.attempts >= job.max_attempts
+        changes = {'error': traceback.format_exc(), 'locked_at': None}
+        if failed:
+            changes.update(status=Job.FAILED, key=None)
+        else:
+            changes.update(
+                status=Job.QUEUED,
+                run_at=timezone.now()
+                + timedelta(seconds=RETRY_DELAY * 2 ** (job.attempts - 1)),
+            )
+        Job.objects.filter(pk=job.pk).update(**changes)
+        return False
+    Job.objects.filter(pk=job.pk).delete()
+    return True
@@ -0,0 +1,119 @@
+import itertools
+import os
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from core.models import MediaFile
+from core.storage import CONTENT_NAME
+
+# Файл, на котором остановился прошлый запуск.
+CURSOR_KEY = 'gc_media:cursor'
+# Сколько файлов проверять одним запросом к MediaFile.
+BATCH_SIZE = 500
+
+
+def walk(root, after=()):
+    """Пути файлов в каталоге root в порядке имён, начиная после after.
+
+    Пути — кортежи частей: так порядок обхода совпадает с порядком
+    сравнения, и обход можно продолжить с любого места.
+    """
+
+    def scan(directory, parts):
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        for entry in entries:
+            path = parts + (entry.name,)
+            if entry.is_dir(follow_symlinks=False):
+                # Каталог целиком пройден, если его путь меньше after и
+                # after лежит не внутри него.
+                if path < after and after[: len(path)] != path:
+                    continue
+                yield from scan(entry.path, path)
+            elif path > after:
+                yield path
+
+    if os.path.isdir(root):
+        yield from scan(root, ())
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из MEDIA_ROOT файлы ContentAddressedStorage, на которые '
+        'нет ссылок, вместе с их миниатюрами. За запуск проверяется не '
+        'больше --limit файлов, следующий запуск продолжает с того же '
+        'места.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=10000,
+            help='Сколько файлов проверить за запуск.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=24 * 60 * 60,
+            help=(
+                'Файлы моложе стольких секунд не удаляются: ссылка на '
+                'только что загруженный файл может быть ещё не сохранена.'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что было бы удалено.',
+        )
+
+    def handle(self, *args, **options):
+        cursor = cache.get(CURSOR_KEY, '')
+        after = tuple(cursor.split('/')) if cursor else ()
+        paths = walk(settings.MEDIA_ROOT, after)
+        checked = removed = 0
+        finished = False
+        while checked < options['limit']:
+            size = min(BATCH_SIZE, options['limit'] - checked)
+            batch = ['/'.join(path) for path in itertools.islice(paths, size)]
+            if not batch:
+                finished = True
+                break
+            checked += len(batch)
+            cursor = batch[-1]
+            removed += self.collect(batch, options)
+        if not options['dry_run']:
+            cache.set(CURSOR_KEY, '' if finished else cursor, None)
+        self.stdout.write(
+            f'Проверено файлов: {checked}, удалено: {removed}'
+            + ('. Обход закончен.' if finished else '.')
+        )
+
+    def collect(self, names, options):
+        names = [name for name in names if CONTENT_NAME.fullmatch(name)]
+        referenced = set(
+            MediaFile.objects.filter(name__in=names, refs__gt=0).values_list(
+                'name', flat=True
+            )
+        )
+        deadline = time.time() - options['min_age']
+        removed = 0
+        for name in names:
+            if name in referenced:
+                continue
+            if default_storage.get_modified_time(name).timestamp() > deadline:
+                continue
+            removed += 1
+            if options['dry_run']:
+                self.stdout.write(f'Удалить {name}')
+                continue
+            # Вместе с файлом удаляются его миниатюры и записи kvstore.
+            delete(ImageFile(name, default_storage))
+            MediaFile.objects.filter(name=name, refs=0).delete()
+        return removed
@@ -0,0 +1,120 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import (
+    OperationalError,
+    close_old_connections,
+    connection,
+    connections,
+)
+
+from core import jobs
+from core.metrics import REGISTRY
+
+# Как часто воркер без задач заглядывает в очередь.
+POLL_INTERVAL = 1
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет фоновые задачи из очереди (core.jobs). Каждый процесс '
+        'запускает --threads потоков; SIGTERM и SIGINT дают потокам '
+        'закончить текущие задачи.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Выйти, когда в очереди не останется срочных задач.',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] == 1:
+            self.run_threads(options['threads'], options['burst'])
+            return
+        # Соединения с базой не должны достаться дочерним процессам.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        processes = [
+            context.Process(
+                target=self.run_threads,
+                args=(options['threads'], options['burst']),
+            )
+            for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+
+        def stop(signum, frame):
+            for process in processes:
+                process.terminate()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for process in processes:
+            process.join()
+
+    def run_threads(self, count, burst):
+        stopping = threading.Event()
+        handlers = {
+            signum: signal.signal(signum, lambda signum, frame: stopping.set())
+            for signum in (signal.SIGTERM, signal.SIGINT)
+        }
+        names = [
+            f'{socket.gethostname()}:{os.getpid()}:{number}'
+            for number in range(count)
+        ]
+        try:
+            if count == 1:
+                self.work(names[0], stopping, burst)
+            else:
+                threads = [
+                    threading.Thread(
+                        target=self.work_in_thread,
+                        args=(name, stopping, burst),
+                    )
+                    for name in names
+                ]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            REGISTRY.flush()
+
+    def work_in_thread(self, *args):
+        try:
+            self.work(*args)
+        finally:
+            connections.close_all()
+
+    def work(self, worker, stopping, burst):
+        done = 0
+        while not stopping.is_set():
+            # Соединение внутри чужой транзакции (например, теста)
+            # закрывать нельзя.
+            if not connection.in_atomic_block:
+                close_old_connections()
+            try:
+                job = jobs.claim(worker)
+            except OperationalError:
+                # База занята другим процессом — попробуем позже.
+                stopping.wait(POLL_INTERVAL)
+                continue
+            if job is None:
+                if burst:
+                    break
+                stopping.wait(POLL_INTERVAL)
+                continue
+            done += jobs.run(job)
+            REGISTRY.maybe_flush()
+        self.stdout.write(f'{worker}: выполнено задач {done}')
@@ -0,0 +1,236 @@
+import atexit
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    family TEXT NOT NULL,
+    suffix TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (family, suffix, labels, le)
+);
+"""
+UPSERT = (
+    'INSERT INTO metrics (family, suffix, labels, le, value) '
+    'VALUES (?, ?, ?, ?, ?) '
+    'ON CONFLICT (family, suffix, labels, le) '
+    'DO UPDATE SET value = value + excluded.value'
+)
+# Границы корзин гистограмм по умолчанию (как у клиентов Prometheus).
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Как часто процесс сбрасывает накопленные приращения в общий файл.
+FLUSH_INTERVAL = 1
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value):
+    return (
+        str(value)
+        .replace('\\', '\\\\')
+        .replace('\n', '\\n')
+        .replace('"', '\\"')
+    )
+
+
+def _labels(pairs):
+    if not pairs:
+        return ''
+    body = ','.join(f'{name}="{_escape(value)}"' for name, value in pairs)
+    return f'{{{body}}}'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.registry = registry or REGISTRY
+        self.registry.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(
+                f'{self.name}: ожидаются метки {self.labelnames}, '
+                f'получены {tuple(labels)}'
+            )
+        return json.dumps(
+            [[name, str(labels[name])] for name in self.labelnames]
+        )
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        self.registry.add(self.name, '', self._key(labels), '', amount)
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, *args, buckets=DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # Корзины хранятся накопительно, как их отдаёт Prometheus.
+        # Нулевые приращения заводят строки всех корзин сразу.
+        for bound in self.buckets:
+            self.registry.add(
+                self.name,
+                '_bucket',
+                key,
+                _format_value(bound),
+                int(value <= bound),
+            )
+        self.registry.add(self.name, '_sum', key, '', value)
+        self.registry.add(self.name, '_count', key, '', 1)
+
+
+class Registry:
+    """Метрики всех процессов сервера.
+
+    Процесс копит приращения в памяти и не чаще раза в FLUSH_INTERVAL
+    секунд прибавляет их к значениям в файле SQLite (METRICS_DB),
+    поэтому /metrics любого воркера отдаёт сумму по всем воркерам без
+    внешнего сервиса.
+    """
+
+    def __init__(self, location=None):
+        self.location = location
+        self.metrics = {}
+        self.pending = defaultdict(float)
+        self.flushed = time.monotonic()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def register(self, metric):
+        if metric.name in self.metrics:
+            raise ValueError(f'Метрика {metric.name} уже зарегистрирована.')
+        self.metrics[metric.name] = metric
+
+    def add(self, family, suffix, labels, le, amount):
+        with self._lock:
+            self.pending[family, suffix, labels, le] += amount
+
+    @property
+    def _connection(self):
+        location = self.location or settings.METRICS_DB
+        # После fork соединение родителя использовать нельзя.
+        if (
+            getattr(self._local, 'pid', None) != os.getpid()
+            or self._local.location != location
+        ):
+            connection = sqlite3.connect(
+                location, timeout=30, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.location = location
+        return self._local.connection
+
+    def flush(self):
+        with self._lock:
+            pending, self.pending = self.pending, defaultdict(float)
+            self.flushed = time.monotonic()
+        if pending:
+            self._connection.executemany(
+                UPSERT, [key + (value,) for key, value in pending.items()]
+            )
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= FLUSH_INTERVAL:
+            self.flush()
+
+    def reset(self):
+        """Удаляет все значения, в том числе других процессов."""
+        with self._lock:
+            self.pending.clear()
+        self._connection.execute('DELETE FROM metrics')
+
+    def expose(self):
+        """Все метрики в текстовом формате Prometheus."""
+        self.flush()
+        rows = defaultdict(list)
+        for family, suffix, labels, le, value in self._connection.execute(
+            'SELECT family, suffix, labels, le, value FROM metrics'
+        ):
+            rows[family].append((labels, suffix, le, value))
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append(f'# HELP {name} {_escape(metric.documentation)}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            # Корзины гистограммы идут по возрастанию границы, затем
+            # _sum и _count.
+            for labels, suffix, le, value in sorted(
+                rows[name],
+                key=lambda row: (
+                    row[0],
+                    ('_bucket', '', '_sum', '_count').index(row[1]),
+                    float(row[2] or 0),
+                ),
+            ):
+                pairs = json.loads(labels)
+                if le:
+                    pairs.append(('le', le))
+                lines.append(
+                    f'{name}{suffix}{_labels(pairs)} {_format_value(value)}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+atexit.register(REGISTRY.flush)
+
+REQUESTS = Counter(
+    'yatube_requests_total',
+    'Число обработанных запросов.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'yatube_request_duration_seconds',
+    'Время обработки запроса.',
+    ('view',),
+)
+REQUEST_QUERIES = Histogram(
+    'yatube_request_queries',
+    'Число SQL-запросов на запрос.',
+    ('view',),
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100),
+)
+SQL_DURATION = Counter(
+    'yatube_sql_seconds_total',
+    'Суммарное время SQL-запросов.',
+    ('view',),
+)
+CACHE_REQUESTS = Counter(
+    'yatube_cache_requests_total',
+    'Обращения к кешу страниц и карточек постов.',
+    ('cache', 'result'),
+)
+THUMBNAIL_DURATION = Histogram(
+    'yatube_thumbnail_generation_seconds',
+    'Время создания миниатюры.',
+)
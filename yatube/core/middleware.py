@@ -0,0 +1,199 @@
+import cProfile
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connection
+from django.template.base import Template
+from django.utils import timezone
+from sorl.thumbnail import default as thumbnail_default
+
+from .metrics import (
+    REGISTRY,
+    REQUEST_DURATION,
+    REQUEST_QUERIES,
+    REQUESTS,
+    SQL_DURATION,
+)
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Порядок и описания метрик в заголовке Server-Timing. Заголовки
+# HTTP передаются в latin-1, поэтому описания на английском.
+METRICS = (
+    ('sql', 'SQL'),
+    ('template', 'Templates'),
+    ('thumbnail', 'Thumbnails'),
+    ('view', 'View code'),
+)
+
+
+class Timings:
+    """Время запроса по видам работы.
+
+    Вложенные замеры вычитаются из внешнего: SQL-запрос, выполненный
+    при отрисовке шаблона, учитывается только как SQL. Время вне
+    остальных замеров относится к коду представлений.
+    """
+
+    def __init__(self):
+        self.totals = defaultdict(float)
+        self.queries = 0
+        self.stack = []
+
+    @contextmanager
+    def measure(self, name):
+        # Шаблоны включают друг друга — считается только внешний.
+        if self.stack and self.stack[-1] == name:
+            yield
+            return
+        self.stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.stack.pop()
+            self.totals[name] += elapsed
+            if self.stack:
+                self.totals[self.stack[-1]] -= elapsed
+
+    def __call__(self, execute, sql, params, many, context):
+        self.queries += 1
+        with self.measure('sql'):
+            return execute(sql, params, many, context)
+
+    def header(self):
+        metrics = [
+            f'{name};dur={self.totals[name] * 1000:.1f};desc="{desc}"'
+            for name, desc in METRICS
+        ]
+        total = sum(self.totals.values())
+        metrics.append(f'total;dur={total * 1000:.1f}')
+        return ', '.join(metrics)
+
+
+def current_timings():
+    """Замеры запроса, который обрабатывает текущий поток."""
+    return getattr(_local, 'timings', None)
+
+
+def instrument(owner, name, metric):
+    """Засчитывает время вызовов owner.name в metric текущего запроса."""
+    method = getattr(owner, name)
+    if getattr(method, 'timing_metric', None) == metric:
+        return
+
+    @wraps(method)
+    def timed(*args, **kwargs):
+        timings = current_timings()
+        if timings is None:
+            return method(*args, **kwargs)
+        with timings.measure(metric):
+            return method(*args, **kwargs)
+
+    timed.timing_metric = metric
+    setattr(owner, name, timed)
+
+
+class TimingMiddleware:
+    """Разбивает время запроса на SQL, шаблоны, миниатюры и код
+    представлений и отдаёт его в заголовке Server-Timing.
+
+    Запросы сотрудников с вероятностью PROFILE_SAMPLE_RATE (или
+    с параметром ?profile) выполняются под cProfile, результат
+    сохраняется в PROFILE_DIR. Middleware ставится первым, чтобы
+    учитывать и остальные middleware.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrument(Template, '_render', 'template')
+        instrument(
+            thumbnail_default.backend.__class__, 'get_thumbnail', 'thumbnail'
+        )
+
+    def __call__(self, request):
+        timings = request.timings = _local.timings = Timings()
+        try:
+            with timings.measure('view'), connection.execute_wrapper(
+                timings
+            ):
+                response = self.get_response(request)
+        finally:
+            _local.timings = None
+            profile = getattr(request, 'profile', None)
+            if profile is not None:
+                profile.disable()
+                self.save_profile(request, profile)
+        response['Server-Timing'] = timings.header()
+        logger.debug(
+            '%s %s: %s, запросов %d',
+            request.method,
+            request.path,
+            response['Server-Timing'],
+            timings.queries,
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Пользователь известен только после AuthenticationMiddleware.
+        if self.should_profile(request):
+            request.profile = cProfile.Profile()
+            request.profile.enable()
+
+    def should_profile(self, request):
+        user = getattr(request, 'user', None)
+        if user is None or not user.is_staff:
+            return False
+        if 'profile' in request.GET:
+            return True
+        return random.random() < getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+
+    def save_profile(self, request, profile):
+        directory = settings.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        name = re.sub(r'[^\w-]+', '-', request.path).strip('-') or 'index'
+        path = os.path.join(
+            directory,
+            f'{timezone.now():%Y%m%d-%H%M%S-%f}-{os.getpid()}-'
+            f'{request.method}-{name}.prof',
+        )
+        profile.dump_stats(path)
+        logger.info('Профиль %s сохранён в %s', request.path, path)
+
+
+class MetricsMiddleware:
+    """Считает запросы, их время и число SQL-запросов по именам URL.
+
+    Ставится сразу после TimingMiddleware и берёт из него время SQL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+        duration = time.perf_counter() - started
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        REQUESTS.inc(
+            view=view, method=request.method, status=response.status_code
+        )
+        REQUEST_DURATION.observe(duration, view=view)
+        timings = getattr(request, 'timings', None)
+        if timings is not None:
+            REQUEST_QUERIES.observe(timings.queries, view=view)
+            SQL_DURATION.inc(timings.totals['sql'], view=view)
+        REGISTRY.maybe_flush()
+        return response
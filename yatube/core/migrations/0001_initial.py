@@ -0,0 +1,119 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:09
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                (
+                    'id',
+                    models.AutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='ID',
+                    ),
+                ),
+                (
+                    'name',
+                    models.CharField(max_length=200, verbose_name='Задача'),
+                ),
+                (
+                    'args',
+                    models.TextField(
+                        default='[]', verbose_name='Аргументы (JSON)'
+                    ),
+                ),
+                (
+                    'key',
+                    models.CharField(
+                        help_text='Пока задача с ключом в очереди, такая же не ставится.',
+                        max_length=255,
+                        null=True,
+                        unique=True,
+                        verbose_name='Ключ',
+                    ),
+                ),
+                (
+                    'priority',
+                    models.SmallIntegerField(
+                        default=0, verbose_name='Приоритет'
+                    ),
+                ),
+                (
+                    'status',
+                    models.CharField(
+                        choices=[
+                            ('queued', 'В очереди'),
+                            ('running', 'Выполняется'),
+                            ('failed', 'Ошибка'),
+                        ],
+                        default='queued',
+                        max_length=10,
+                        verbose_name='Состояние',
+                    ),
+                ),
+                (
+                    'attempts',
+                    models.PositiveSmallIntegerField(
+                        default=0, verbose_name='Попыток'
+                    ),
+                ),
+                (
+                    'max_attempts',
+                    models.PositiveSmallIntegerField(
+                        default=3, verbose_name='Наибольшее число попыток'
+                    ),
+                ),
+                (
+                    'run_at',
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name='Выполнить после',
+                    ),
+                ),
+                (
+                    'locked_at',
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name='Взята в работу'
+                    ),
+                ),
+                (
+                    'worker',
+                    models.CharField(
+                        blank=True, max_length=100, verbose_name='Воркер'
+                    ),
+                ),
+                (
+                    'error',
+                    models.TextField(
+                        blank=True, verbose_name='Последняя ошибка'
+                    ),
+                ),
+                (
+                    'created',
+                    models.DateTimeField(
+                        auto_now_add=True, verbose_name='Дата создания'
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Фоновая задача',
+                'verbose_name_plural': 'Фоновые задачи',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(
+                fields=['status', '-priority', 'run_at'], name='job_queue_idx'
+            ),
+        ),
+    ]
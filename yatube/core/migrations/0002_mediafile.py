@@ -0,0 +1,36 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaFile',
+            fields=[
+                (
+                    'name',
+                    models.CharField(
+                        max_length=255,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='Файл',
+                    ),
+                ),
+                (
+                    'refs',
+                    models.PositiveIntegerField(
+                        default=0, verbose_name='Число ссылок'
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Медиафайл',
+                'verbose_name_plural': 'Медиафайлы',
+            },
+        ),
+    ]
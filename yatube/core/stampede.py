@@ -0,0 +1,93 @@
+import math
+import random
+import time
+
+from django.core.cache import cache as default_cache
+
+# Сколько устаревшее значение ещё хранится после логического истечения
+# и может отдаваться, пока один запрос его пересчитывает.
+STALE_TTL = 60
+# Наибольшее время пересчёта: после него аренду может взять другой запрос.
+LEASE_TIMEOUT = 30
+# Как часто запрос без значения в кеше проверяет, не пересчитано ли оно.
+POLL_INTERVAL = 0.05
+
+
+def _expired_early(expires, delta, beta):
+    """Вероятностное досрочное истечение (XFetch).
+
+    Чем ближе срок и чем дороже пересчёт (delta), тем вероятнее запрос
+    обновит значение заранее, поэтому записи не истекают одновременно.
+    """
+    return time.time() - delta * beta * math.log(random.random()) >= expires
+
+
+def _wait(cache, key, lease_key):
+    """Ждёт, пока значение пересчитает другой запрос.
+
+    Возвращает запись из кеша или None, если аренду удалось взять —
+    тогда значение считает сам вызвавший.
+    """
+    deadline = time.time() + LEASE_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+        if cache.add(lease_key, 1, LEASE_TIMEOUT):
+            return None
+    return None
+
+
+def get_or_refresh(
+    key,
+    compute,
+    timeout,
+    cache=None,
+    beta=1.0,
+    cacheable=None,
+    stale_key=None,
+):
+    """Значение из кеша; при промахе его пересчитывает только один запрос.
+
+    Пересчёт защищён арендой (cache.add): пока значение пересчитывается,
+    остальные запросы получают устаревшее значение, а при его отсутствии
+    ждут до LEASE_TIMEOUT секунд и только потом считают сами.
+    cacheable(value) решает, можно ли сохранить пересчитанное значение.
+
+    Если в key входит версия содержимого, после её смены устаревшего
+    значения под новым ключом нет. Тогда его берут из stale_key — ключа
+    без версии, где лежит последнее сохранённое значение любой версии.
+    """
+    cache = cache or default_cache
+    lease_key = f'{key}:lease'
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        if not _expired_early(expires, delta, beta):
+            return value
+        if not cache.add(lease_key, 1, LEASE_TIMEOUT):
+            return value
+    elif not cache.add(lease_key, 1, LEASE_TIMEOUT):
+        entry = cache.get(stale_key) if stale_key else None
+        if entry is None:
+            entry = _wait(cache, key, lease_key)
+        if entry is not None:
+            return entry[0]
+    try:
+        started = time.time()
+        value = compute()
+        delta = time.time() - started
+        if cacheable is None or cacheable(value):
+            store(key, value, timeout, delta, cache, stale_key)
+    finally:
+        cache.delete(lease_key)
+    return value
+
+
+def store(key, value, timeout, delta=0, cache=None, stale_key=None):
+    """Кладёт значение в формате get_or_refresh."""
+    cache = cache or default_cache
+    entry = (value, time.time() + timeout, delta)
+    keys = [key, stale_key] if stale_key else [key]
+    cache.set_many(dict.fromkeys(keys, entry), timeout + STALE_TTL)
@@ -0,0 +1,88 @@
+import hashlib
+import os
+import posixpath
+import re
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import MediaFile
+
+# Имя файла, выданное ContentAddressedStorage: каталог загрузки,
+# первые два символа хеша и сам хеш.
+CONTENT_NAME = re.compile(r'(?:.+/)?([0-9a-f]{2})/\1[0-9a-f]{62}(?:\.\w+)?')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, которое называет файлы по SHA-256 их содержимого.
+
+    Файл считается потоком по кускам (File.chunks), поэтому большие
+    загрузки не читаются в память целиком. Файл с таким содержимым уже
+    есть — он не записывается заново, а загрузка получает то же имя.
+    Ссылки на файлы считаются в MediaFile (retain и release), файлы без
+    ссылок удаляет команда gc_media.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = self.content_name(name, digest.hexdigest())
+        if not self.exists(name):
+            try:
+                return self._save(name, content)
+            except FileExistsError:
+                # Тот же файл между exists() и _save() записал
+                # параллельный запрос (см. get_available_name).
+                pass
+        # Свежее время изменения защищает файл от gc_media, пока
+        # ссылка на него ещё не сохранена.
+        os.utime(self.path(name))
+        return name
+
+    def get_available_name(self, name, max_length=None):
+        """Другого имени у содержимого нет.
+
+        FileSystemStorage._save спрашивает его, когда файл с таким
+        именем уже есть, то есть с тем же содержимым. Вместо имени
+        с суффиксом вызывающему отдаётся FileExistsError.
+        """
+        raise FileExistsError(name)
+
+    def content_name(self, name, digest):
+        directory, filename = posixpath.split(name)
+        extension = os.path.splitext(filename)[1].lower()
+        return posixpath.join(directory, digest[:2], digest + extension)
+
+
+def retain(name):
+    """Добавляет ссылку на файл.
+
+    Возвращает True, если других ссылок на него не было, то есть файл
+    только что загружен впервые.
+    """
+    if MediaFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') + 1
+    ):
+        return False
+    try:
+        with transaction.atomic():
+            MediaFile.objects.create(name=name, refs=1)
+    except IntegrityError:
+        # Строка осталась от удалённых ссылок или её только что создал
+        # параллельный запрос.
+        MediaFile.objects.filter(name=name).update(refs=F('refs') + 1)
+    return True
+
+
+def release(name):
+    """Убирает ссылку на файл; сам файл удалит gc_media."""
+    MediaFile.objects.filter(name=name, refs__gt=0).update(
+        refs=F('refs') - 1
+    )
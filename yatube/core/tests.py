@@ -1,4 +1,54 @@
-from django.test import TestCase
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.paginator import Paginator
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.test import override_settings
+from django.utils import timezone
+
+from . import jobs, stampede, storage
+from .cache import SQLiteCache
+from .decorators import QueryBudgetExceeded, cache_page, query_budget
+from .metrics import REGISTRY, Counter, Histogram, Registry
+from .middleware import Timings
+from .models import Job, MediaFile
+from .templatetags.pagination import elided_page_range
+from .thumbnails import PictureSpec, QueuedThumbnailBackend
+
+User = get_user_model()
+
+
+CALLS = []
+
+
+@jobs.task
+def remember(value):
+    CALLS.append(value)
+
+
+@jobs.task(max_attempts=2)
+def broken():
+    raise ValueError('сломано')
+
+
+def make_view(queries):
+    def view(request):
+        for _ in range(queries):
+            User.objects.exists()
+        return HttpResponse()
+
+    return view
 
 
 class ViewTestClass(TestCase):
@@ -6,3 +56,493 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, 404)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+class QueryBudgetTest(TestCase):
+    def setUp(self):
+        self.request = RequestFactory().get('/')
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_view_within_budget(self):
+        """Представление в пределах бюджета отрабатывает как обычно."""
+        response = query_budget(2)(make_view(2))(self.request)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_budget_exceeded_raises(self):
+        """При QUERY_BUDGET_RAISE превышение бюджета — исключение."""
+        with self.assertRaises(QueryBudgetExceeded):
+            query_budget(2)(make_view(3))(self.request)
+
+    @override_settings(QUERY_BUDGET_RAISE=False)
+    def test_budget_exceeded_logs(self):
+        """Без QUERY_BUDGET_RAISE превышение бюджета пишется в лог."""
+        with self.assertLogs('core.decorators', 'WARNING'):
+            response = query_budget(2)(make_view(3))(self.request)
+        self.assertEqual(response.status_code, 200)
+
+
+def increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class TimingMiddlewareTest(TestCase):
+    def test_server_timing_header(self):
+        """Ответ содержит время SQL, шаблонов и кода представлений."""
+        response = self.client.get('/about/author/')
+        header = response['Server-Timing']
+        for metric in ('sql', 'template', 'thumbnail', 'view', 'total'):
+            self.assertIn(f'{metric};dur=', header)
+
+    def test_nested_measures_are_exclusive(self):
+        """Время вложенного замера не засчитывается внешнему."""
+        timings = Timings()
+        with mock.patch('time.perf_counter', side_effect=[0, 1, 3, 10]):
+            with timings.measure('view'):
+                with timings.measure('sql'):
+                    pass
+        self.assertEqual(timings.totals, {'view': 8, 'sql': 2})
+
+    def test_staff_request_profiled(self):
+        """Запрос сотрудника с ?profile сохраняет файл .prof."""
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        user = User.objects.create_user(username='user')
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILE_DIR=directory):
+                self.client.force_login(user)
+                self.client.get('/about/author/?profile')
+                self.assertEqual(os.listdir(directory), [])
+                self.client.force_login(staff)
+                self.client.get('/about/author/?profile')
+                (name,) = os.listdir(directory)
+        self.assertTrue(name.endswith('-GET-about-author.prof'))
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'metrics.sqlite3')
+
+    def test_exposition_format(self):
+        """Счётчики и гистограммы выводятся в формате Prometheus."""
+        registry = Registry(self.location)
+        counter = Counter('hits_total', 'Hits.', ('page',), registry)
+        histogram = Histogram(
+            'latency_seconds', 'Latency.', registry=registry, buckets=(1, 2)
+        )
+        counter.inc(page='a"b')
+        histogram.observe(1.5)
+        self.assertEqual(
+            registry.expose(),
+            '# HELP hits_total Hits.\n'
+            '# TYPE hits_total counter\n'
+            'hits_total{page="a\\"b"} 1\n'
+            '# HELP latency_seconds Latency.\n'
+            '# TYPE latency_seconds histogram\n'
+            'latency_seconds_bucket{le="1"} 0\n'
+            'latency_seconds_bucket{le="2"} 1\n'
+            'latency_seconds_bucket{le="+Inf"} 1\n'
+            'latency_seconds_sum 1.5\n'
+            'latency_seconds_count 1\n',
+        )
+
+    def test_workers_aggregated(self):
+        """Значения разных процессов суммируются через общий файл."""
+        workers = [Registry(self.location) for _ in range(2)]
+        for number, registry in enumerate(workers, 1):
+            Counter('hits_total', 'Hits.', registry=registry).inc(number)
+            registry.flush()
+        self.assertIn('hits_total 3\n', workers[0].expose())
+
+    def test_metrics_endpoint(self):
+        """/metrics отдаёт запросы по именам URL и попадания в кеш."""
+        cache.clear()
+        with override_settings(METRICS_DB=self.location, METRICS_TOKEN='t'):
+            REGISTRY.reset()
+            self.client.get('/')
+            self.client.get('/')
+            response = self.client.get(
+                '/metrics', HTTP_AUTHORIZATION='Bearer t'
+            )
+        self.assertEqual(response.status_code, 200)
+        for line in (
+            'yatube_requests_total{view="posts:index",method="GET",'
+            'status="200"} 2',
+            'yatube_cache_requests_total{cache="index_page",result="hit"} 1',
+            'yatube_cache_requests_total{cache="index_page",result="miss"} 1',
+            'yatube_request_duration_seconds_count{view="posts:index"} 2',
+            'yatube_request_queries_count{view="posts:index"} 2',
+        ):
+            self.assertIn(line, response.content.decode())
+
+    @override_settings(METRICS_TOKEN='t')
+    def test_metrics_endpoint_forbidden(self):
+        """Метрики недоступны без токена, в том числе с loopback."""
+        for headers in (
+            {'REMOTE_ADDR': '10.0.0.1'},
+            {'REMOTE_ADDR': '127.0.0.1'},
+            {'HTTP_AUTHORIZATION': 'Bearer wrong'},
+        ):
+            with self.subTest(headers=headers):
+                response = self.client.get('/metrics', **headers)
+                self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=('10.0.0.2',))
+    def test_metrics_endpoint_allowed_ip(self):
+        """Адресам из METRICS_ALLOWED_IPS токен не нужен."""
+        response = self.client.get('/metrics', REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 200)
+
+
+class JobQueueTest(TestCase):
+    def setUp(self):
+        CALLS.clear()
+
+    def work(self):
+        call_command('runworker', '--burst', '--threads=1', stdout=StringIO())
+
+    def test_jobs_run_by_priority(self):
+        """Воркер выполняет задачи по приоритету и удаляет выполненные."""
+        remember.enqueue('обычная')
+        remember.enqueue('срочная', priority=5)
+        remember.enqueue('отложенная', delay=60)
+        self.work()
+        self.assertEqual(CALLS, ['срочная', 'обычная'])
+        self.assertEqual(Job.objects.get().args, '["отложенная"]')
+
+    def test_same_key_enqueued_once(self):
+        """Задача с ключом не ставится, пока такая же в очереди."""
+        self.assertIsNotNone(remember.enqueue(1, key='once'))
+        self.assertIsNone(remember.enqueue(2, key='once'))
+        self.work()
+        self.assertEqual(CALLS, [1])
+        self.assertIsNotNone(remember.enqueue(3, key='once'))
+
+    def test_enqueue_many_skips_queued_keys(self):
+        """enqueue_many ставит задачи одним запросом, пропуская ключи
+        из очереди."""
+        remember.enqueue(1, key='first')
+        with self.assertNumQueries(1):
+            jobs.enqueue_many(
+                [
+                    remember.job((2,), key='first'),
+                    remember.job((3,), key='second'),
+                ]
+            )
+        self.assertEqual(
+            jobs.pending(['first', 'second', 'third']), {'first', 'second'}
+        )
+        self.work()
+        self.assertEqual(sorted(CALLS), [1, 3])
+
+    def test_failed_job_retried_then_failed(self):
+        """Упавшая задача повторяется с задержкой, а потом остаётся FAILED."""
+        job = broken.enqueue()
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.work()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('сломано', job.error)
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.work()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+
+    def test_abandoned_job_reclaimed(self):
+        """Задачу упавшего воркера берёт другой воркер."""
+        job = remember.enqueue('брошенная')
+        self.assertEqual(jobs.claim('упавший'), job)
+        self.assertIsNone(jobs.claim('живой'))
+        Job.objects.update(
+            locked_at=timezone.now()
+            - timezone.timedelta(seconds=jobs.LOCK_TIMEOUT + 1)
+        )
+        self.work()
+        self.assertEqual(CALLS, ['брошенная'])
+
+
+class PictureSpecTest(SimpleTestCase):
+    def test_variants_keep_proportions(self):
+        picture = PictureSpec(960, 339, (480, 1440), ('AVIF', 'JPEG'), {})
+        self.assertEqual(
+            [
+                (format_, width, spec.geometry, spec.options['format'])
+                for format_, width, spec in picture.variants()
+            ],
+            [
+                ('AVIF', 480, '480x170', 'AVIF'),
+                ('AVIF', 1440, '1440x508', 'AVIF'),
+                ('JPEG', 480, '480x170', 'JPEG'),
+                ('JPEG', 1440, '1440x508', 'JPEG'),
+            ],
+        )
+
+    def test_avif_extension(self):
+        thumbnail = QueuedThumbnailBackend().thumbnail_file(
+            'posts/photo.jpg', '480x170', format='AVIF'
+        )
+        self.assertTrue(thumbnail.name.endswith('.avif'))
+
+
+class MediaStorageTest(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(MEDIA_ROOT=directory.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+
+    def save(self, content):
+        name = default_storage.save('posts/a.txt', ContentFile(content))
+        # Файл старше --min-age.
+        old = time.time() - 60
+        os.utime(default_storage.path(name), (old, old))
+        return name
+
+    def test_same_content_same_file(self):
+        """Файлы называются по хешу, одинаковые хранятся один раз."""
+        name = self.save(b'data')
+        self.assertRegex(name, r'^posts/3a/3a6eb079[0-9a-f]{56}\.txt$')
+        self.assertEqual(self.save(b'data'), name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(default_storage.path(name))),
+            [os.path.basename(name)],
+        )
+        self.assertTrue(storage.retain(name))
+        self.assertFalse(storage.retain(name))
+        storage.release(name)
+        self.assertEqual(MediaFile.objects.get(name=name).refs, 1)
+
+    def test_concurrent_duplicate_gets_same_name(self):
+        """Файл, записанный параллельно после exists(), не дублируется."""
+        name = self.save(b'data')
+        with mock.patch.object(default_storage, 'exists', return_value=False):
+            self.assertEqual(self.save(b'data'), name)
+        self.assertEqual(
+            os.listdir(os.path.dirname(default_storage.path(name))),
+            [os.path.basename(name)],
+        )
+
+    def test_gc_removes_unreferenced(self):
+        """gc_media удаляет старые файлы без ссылок."""
+        kept, released, unknown = (
+            self.save(content) for content in (b'kept', b'released', b'?')
+        )
+        young = default_storage.save('posts/b.txt', ContentFile(b'young'))
+        # Файлы, записанные не через хранилище, не трогаются.
+        other = 'other.txt'
+        with open(default_storage.path(other), 'wb') as file_:
+            file_.write(b'other')
+        old = time.time() - 60
+        os.utime(default_storage.path(other), (old, old))
+        storage.retain(kept)
+        storage.retain(released)
+        storage.release(released)
+        call_command('gc_media', '--min-age=30', stdout=StringIO())
+        self.assertEqual(
+            {
+                name
+                for name in (kept, released, unknown, young, other)
+                if default_storage.exists(name)
+            },
+            {kept, young, other},
+        )
+        self.assertFalse(MediaFile.objects.filter(name=released).exists())
+
+    def test_gc_is_incremental(self):
+        """Каждый запуск gc_media продолжает обход с прошлого места."""
+        names = sorted(self.save(bytes([number])) for number in range(5))
+        out = StringIO()
+        for _ in range(3):
+            call_command('gc_media', '--limit=2', '--min-age=30', stdout=out)
+        self.assertFalse(any(default_storage.exists(name) for name in names))
+        self.assertIn(
+            'Проверено файлов: 1, удалено: 1. Обход закончен.', out.getvalue()
+        )
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def test_set_get_delete(self):
+        """Значения сохраняются, читаются и удаляются."""
+        self.cache.set('key', {'value': [1, 2]})
+        self.assertEqual(self.cache.get('key'), {'value': [1, 2]})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_values_are_missing(self):
+        """Просроченная запись не возвращается и не мешает add."""
+        self.cache.set('key', 'old', timeout=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertFalse(self.cache.add('key', 'newer'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_many(self):
+        """get_many и set_many работают пакетами."""
+        data = {f'key{i}': i for i in range(1200)}
+        self.cache.set_many(data)
+        self.assertEqual(self.cache.get_many(list(data) + ['missing']), data)
+
+    def test_shared_between_processes(self):
+        """Процессы видят общие данные, incr атомарен."""
+        self.cache.set('counter', 0)
+        workers = [
+            multiprocessing.Process(
+                target=increment, args=(self.location, 50)
+            )
+            for _ in range(4)
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_incr_missing_key(self):
+        """incr отсутствующего ключа — ValueError, как в других кешах."""
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_lru_eviction_by_size(self):
+        """При переполнении вытесняются давно не читавшиеся записи."""
+        cache = SQLiteCache(
+            self.location,
+            {'OPTIONS': {'MAX_BYTES': 5000, 'ACCESS_RESOLUTION': 0}},
+        )
+        cache.set('hot', 'x' * 1000)
+        for i in range(10):
+            cache.get('hot')
+            cache.set(f'cold{i}', 'x' * 1000)
+        self.assertEqual(cache.get('hot'), 'x' * 1000)
+        self.assertIsNone(cache.get('cold0'))
+        size = cache._connection.execute(
+            'SELECT SUM(size) FROM cache'
+        ).fetchone()[0]
+        self.assertLessEqual(size, 5000)
+
+
+class StampedeTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = SQLiteCache(
+            os.path.join(directory.name, 'cache.sqlite3'), {}
+        )
+        self.calls = 0
+
+    def slow_compute(self):
+        self.calls += 1
+        time.sleep(0.2)
+        return self.calls
+
+    def test_concurrent_misses_compute_once(self):
+        """При одновременном промахе значение считает один запрос."""
+        results = []
+
+        def worker():
+            results.append(
+                stampede.get_or_refresh(
+                    'key', self.slow_compute, 60, self.cache
+                )
+            )
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(results, [1] * 8)
+
+    def test_stale_value_served_during_refresh(self):
+        """Пока значение пересчитывается, отдаётся устаревшее."""
+        stampede.store('key', 'old', -1, cache=self.cache)
+        self.cache.add('key:lease', 1)
+        value = stampede.get_or_refresh(
+            'key', self.slow_compute, 60, self.cache
+        )
+        self.assertEqual(value, 'old')
+        self.assertEqual(self.calls, 0)
+
+    def test_previous_version_served_during_refresh(self):
+        """После смены версии, пока ключ пересчитывается, отдаётся
+        значение прошлой версии из ключа без версии."""
+        stampede.store('key:1', 'old', 60, cache=self.cache, stale_key='key')
+        self.cache.add('key:2:lease', 1)
+        value = stampede.get_or_refresh(
+            'key:2', self.slow_compute, 60, self.cache, stale_key='key'
+        )
+        self.assertEqual(value, 'old')
+        self.assertEqual(self.calls, 0)
+
+    def test_early_refresh(self):
+        """Дорогое значение обновляется до истечения срока."""
+        stampede.store('key', 'old', 1, delta=10, cache=self.cache)
+        with mock.patch.object(stampede.random, 'random', return_value=0.5):
+            value = stampede.get_or_refresh(
+                'key', lambda: 'new', 60, self.cache
+            )
+        self.assertEqual(value, 'new')
+        self.assertIsNone(self.cache.get('key:lease'))
+
+    def test_uncacheable_value_not_stored(self):
+        """Значение, отвергнутое cacheable, не сохраняется."""
+        value = stampede.get_or_refresh(
+            'key', lambda: '', 60, self.cache, cacheable=bool
+        )
+        self.assertEqual(value, '')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertIsNone(self.cache.get('key:lease'))
+
+    def test_cache_page(self):
+        """cache_page отдаёт закешированный ответ без вызова представления."""
+        calls = []
+
+        def view(request):
+            calls.append(request)
+            return HttpResponse(str(len(calls)))
+
+        cached = cache_page(60)(view)
+        request = RequestFactory().get('/stampede/')
+        with mock.patch('core.decorators.default_cache', self.cache):
+            first = cached(request)
+            second = cached(RequestFactory().get('/stampede/'))
+        self.assertEqual(first.content, b'1')
+        self.assertEqual(second.content, b'1')
+        self.assertEqual(len(calls), 1)
+        self.assertIn('max-age=60', second['Cache-Control'])
+
+
+class ElidedPageRangeTest(SimpleTestCase):
+    def page_range(self, number, count=1000):
+        paginator = Paginator(range(count), 10)
+        return elided_page_range(paginator.page(number))
+
+    def test_few_pages_are_not_elided(self):
+        """Если страниц немного, выводятся все."""
+        self.assertEqual(self.page_range(2, 50), [1, 2, 3, 4, 5])
+
+    def test_middle_page(self):
+        """Вокруг текущей страницы окно, по краям — первые и последние."""
+        self.assertEqual(
+            self.page_range(50),
+            [1, 2, None, 47, 48, 49, 50, 51, 52, 53, None, 99, 100],
+        )
+
+    def test_edge_pages(self):
+        """У краёв пропуск только с одной стороны."""
+        self.assertEqual(self.page_range(1), [1, 2, 3, 4, None, 99, 100])
+        self.assertEqual(self.page_range(100), [1, 2, None, 97, 98, 99, 100])
@@ -0,0 +1,305 @@
+import hashlib
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from PIL import Image
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS as SORL_EXTENSIONS
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.helpers import serialize, tokey
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import KVStore, EMPTY_VALUE
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .jobs import enqueue_many, pending, task
+from .metrics import THUMBNAIL_DURATION
+
+_local = threading.local()
+
+# Расширения файлов миниатюр; AVIF sorl не знает.
+EXTENSIONS = {**SORL_EXTENSIONS, 'AVIF': 'avif'}
+
+# Отправляется, когда миниатюра из очереди создана. Страницы, которые
+# показывали вместо неё исходную картинку, можно сбросить.
+thumbnail_generated = Signal(providing_args=['name'])
+
+
+class Deferred(Exception):
+    """Миниатюры ещё нет, и создавать её в этом потоке нельзя."""
+
+
+@contextmanager
+def generating():
+    """Внутри блока миниатюры создаются сразу, а не в очереди."""
+    previous = getattr(_local, 'generating', False)
+    _local.generating = True
+    try:
+        yield
+    finally:
+        _local.generating = previous
+
+
+@contextmanager
+def track_deferred():
+    """Список миниатюр, отложенных внутри блока.
+
+    Разметку с исходной картинкой вместо миниатюры нельзя надолго
+    кешировать.
+    """
+    previous = getattr(_local, 'deferred', None)
+    _local.deferred = deferred = []
+    try:
+        yield deferred
+    finally:
+        _local.deferred = previous
+        if previous is not None:
+            previous.extend(deferred)
+
+
+def note_deferred(image):
+    """Отмечает для track_deferred картинку, показанную вместо миниатюры."""
+    if getattr(_local, 'deferred', None) is not None:
+        _local.deferred.append(image.name)
+
+
+def source_file(file_):
+    """Исходная картинка по имени ищется в хранилище медиа.
+
+    Иначе sorl взял бы хранилище миниатюр (THUMBNAIL_STORAGE), а от
+    хранилища исходника зависят ключи его миниатюр.
+    """
+    if isinstance(file_, str):
+        return ImageFile(file_, default_storage)
+    return file_
+
+
+def queued_original(file_):
+    """Исходная картинка, которая показывается, пока миниатюра в очереди."""
+    image = ImageFile(file_)
+    image.queued = True
+    return image
+
+
+@task(priority=10)
+def generate_thumbnail(name, geometry_string, options):
+    with generating():
+        get_thumbnail(name, geometry_string, **options)
+    thumbnail_generated.send(sender=None, name=name)
+
+
+def thumbnail_job_key(name, geometry_string, options):
+    digest = hashlib.md5(
+        json.dumps([name, geometry_string, options], sort_keys=True).encode()
+    ).hexdigest()
+    return f'thumbnail:{digest}'
+
+
+def queue_thumbnail(name, geometry_string, options, priority=None):
+    """Ставит создание миниатюры в очередь, если оно ещё не стоит."""
+    return generate_thumbnail.enqueue(
+        name,
+        geometry_string,
+        options,
+        key=thumbnail_job_key(name, geometry_string, options),
+        priority=priority,
+    )
+
+
+def queue_thumbnails(items):
+    """Ставит в очередь миниатюры троек (файл, ThumbnailSpec, приоритет).
+
+    Все задачи вставляются одним запросом; уже стоящие в очереди
+    пропускаются.
+    """
+    enqueue_many(
+        [spec.job(file_, priority) for file_, spec, priority in items]
+    )
+
+
+class ThumbnailSpec(NamedTuple):
+    """Размер и параметры миниатюры — аргументы тега {% thumbnail %}."""
+
+    geometry: str
+    options: dict
+
+    def get(self, file_):
+        return get_thumbnail(file_, self.geometry, **self.options)
+
+    def generate(self, file_):
+        """Создаёт миниатюру сразу, минуя очередь."""
+        with generating():
+            return self.get(file_)
+
+    def job(self, file_, priority=None):
+        """Задача создания миниатюры для core.jobs.enqueue_many."""
+        name = getattr(file_, 'name', file_)
+        return generate_thumbnail.job(
+            (name, self.geometry, self.options),
+            thumbnail_job_key(name, self.geometry, self.options),
+            priority,
+        )
+
+
+def supported_formats(formats):
+    """Форматы из formats, в которых Pillow умеет сохранять картинки."""
+    Image.init()
+    return tuple(format_ for format_ in formats if format_ in Image.SAVE)
+
+
+class PictureSpec(NamedTuple):
+    """Миниатюры одних пропорций разной ширины и формата для <picture>.
+
+    width и height — основной размер. Форматы перечисляются в порядке
+    предпочтения, последний — запасной для <img>.
+    """
+
+    width: int
+    height: int
+    widths: tuple
+    formats: tuple
+    options: dict
+
+    def variants(self):
+        """Тройки (формат, ширина, ThumbnailSpec) всех миниатюр."""
+        for format_ in self.formats:
+            for width in self.widths:
+                height = round(width * self.height / self.width)
+                yield format_, width, ThumbnailSpec(
+                    f'{width}x{height}', {**self.options, 'format': format_}
+                )
+
+
+class QueuedThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl-thumbnail, создающий миниатюры в фоновой очереди.
+
+    При THUMBNAIL_QUEUED миниатюра, которой ещё нет, ставится в очередь
+    задачей generate_thumbnail, а до её выполнения вместо миниатюры
+    отдаётся исходная картинка, поэтому время ответа не зависит от
+    размера картинки. Время создания миниатюр пишется в метрику
+    THUMBNAIL_DURATION.
+    """
+
+    def get_thumbnail(self, file_, geometry_string, **options):
+        file_ = source_file(file_)
+        try:
+            return super().get_thumbnail(file_, geometry_string, **options)
+        except Deferred:
+            queue_thumbnail(
+                getattr(file_, 'name', file_), geometry_string, options
+            )
+            image = queued_original(file_)
+            note_deferred(image)
+            return image
+
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """Файл миниатюры без обращения к хранилищу и kvstore.
+
+        Имя вычисляется так же, как в get_thumbnail.
+        """
+        source = ImageFile(source_file(file_))
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        return ImageFile(
+            self._get_thumbnail_filename(source, geometry_string, options),
+            default.storage,
+        )
+
+    def _get_thumbnail_filename(self, source, geometry_string, options):
+        key = tokey(source.key, geometry_string, serialize(options))
+        return (
+            f'{sorl_settings.THUMBNAIL_PREFIX}{key[:2]}/{key[2:4]}/{key}.'
+            f'{EXTENSIONS[options["format"]]}'
+        )
+
+    def _create_thumbnail(self, *args, **kwargs):
+        if settings.THUMBNAIL_QUEUED and not getattr(
+            _local, 'generating', False
+        ):
+            raise Deferred
+        started = time.perf_counter()
+        try:
+            return super()._create_thumbnail(*args, **kwargs)
+        finally:
+            THUMBNAIL_DURATION.observe(time.perf_counter() - started)
+
+
+def _read_kvstore(keys):
+    """Значения kvstore по ключам: одно чтение кеша и один запрос к базе."""
+    kvstore = default.kvstore
+    if not isinstance(kvstore, KVStore):
+        return {key: kvstore._get_raw(key) for key in keys}
+    values = kvstore.cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        found = dict(
+            KVStoreModel.objects.filter(key__in=missing).values_list(
+                'key', 'value'
+            )
+        )
+        # Как и сам kvstore, запоминаем в кеше и отсутствие записи.
+        kvstore.cache.set_many(
+            {key: found.get(key, EMPTY_VALUE) for key in missing},
+            sorl_settings.THUMBNAIL_CACHE_TIMEOUT,
+        )
+        values.update(found)
+    return {
+        key: None if value == EMPTY_VALUE else value
+        for key, value in values.items()
+    }
+
+
+def lookup_thumbnails(items):
+    """Миниатюры для пар (файл, ThumbnailSpec) без ввода-вывода на каждую.
+
+    Готовые миниатюры (с размерами) читаются из kvstore sorl одним
+    обращением к кешу и базе. Вместо отсутствующих при THUMBNAIL_QUEUED
+    возвращается исходная картинка, а миниатюра ставится в очередь;
+    иначе она создаётся сразу. Уже стоящие в очереди миниатюры
+    находятся одним запросом и повторно не ставятся, поэтому страница
+    с ожидающими миниатюрами ничего не пишет в базу.
+    """
+    backend = default.backend
+    thumbnails = [
+        backend.thumbnail_file(file_, spec.geometry, **spec.options)
+        for file_, spec in items
+    ]
+    values = _read_kvstore([add_prefix(thumb.key) for thumb in thumbnails])
+    queued = settings.THUMBNAIL_QUEUED and not getattr(
+        _local, 'generating', False
+    )
+    missing = {}
+    result = []
+    for (file_, spec), thumbnail in zip(items, thumbnails):
+        value = values.get(add_prefix(thumbnail.key))
+        if value is not None:
+            result.append(deserialize_image_file(value))
+        elif queued:
+            name = getattr(file_, 'name', file_)
+            key = thumbnail_job_key(name, spec.geometry, spec.options)
+            missing[key] = (name, spec)
+            result.append(queued_original(file_))
+        else:
+            result.append(spec.get(file_))
+    if missing:
+        already_queued = pending(missing)
+        queue_thumbnails(
+            (name, spec, None)
+            for key, (name, spec) in missing.items()
+            if key not in already_queued
+        )
+    return result
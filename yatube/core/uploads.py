@@ -0,0 +1,142 @@
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile, UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Параметры сохранения картинок, которые приводятся к UPLOAD_IMAGE_MAX_SIZE.
+# Остальные форматы (например, анимированный GIF) сохраняются как есть.
+FORMATS = {
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+
+
+class ImageTooLarge(Exception):
+    """Картинка слишком велика, чтобы её декодировать."""
+
+
+class RejectedUpload(SimpleUploadedFile):
+    """Пустой файл вместо отвергнутой загрузки; причина — в upload_error."""
+
+    def __init__(self, name, content_type, error):
+        super().__init__(name, b'', content_type)
+        self.upload_error = error
+
+
+def spooled_file():
+    """Файл в памяти, который на диск переходит только при росте."""
+    return tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE,
+        dir=settings.FILE_UPLOAD_TEMP_DIR,
+    )
+
+
+def normalize_image(source):
+    """Уменьшенная копия картинки без метаданных или None.
+
+    JPEG декодируется в режиме draft — сразу в масштабе 1/2, 1/4 или 1/8,
+    поэтому память зависит от UPLOAD_IMAGE_MAX_SIZE, а не от размера
+    снимка. None — формат не приводится, файл сохраняется как есть.
+    Слишком большая и после draft картинка даёт ImageTooLarge.
+    """
+    max_size = (settings.UPLOAD_IMAGE_MAX_SIZE,) * 2
+    with Image.open(source) as image:
+        if image.format not in FORMATS:
+            return None
+        format_ = image.format
+        # draft берёт наибольший масштаб, при котором обе стороны не
+        # меньше заданных, поэтому размер нужен с пропорциями снимка.
+        width, height = image.size
+        scale = min(max_size[0] / width, max_size[1] / height)
+        image.draft(
+            'RGB', (max(int(width * scale), 1), max(int(height * scale), 1))
+        )
+        if image.width * image.height > settings.UPLOAD_IMAGE_MAX_PIXELS:
+            raise ImageTooLarge(
+                f'Картинка больше '
+                f'{settings.UPLOAD_IMAGE_MAX_PIXELS // 10 ** 6} Мпикс.'
+            )
+        # Поворот из EXIF применяется сразу: сами метаданные не сохраняются.
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail(max_size)
+    if format_ == 'JPEG' and image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    output = spooled_file()
+    # Цветовой профиль — не метаданные: без него цвета исказятся. PNG
+    # без явного exif записал бы EXIF исходника из image.info.
+    image.save(
+        output,
+        format_,
+        exif=b'',
+        icc_profile=image.info.get('icc_profile'),
+        **FORMATS[format_],
+    )
+    return output
+
+
+class ImageUploadHandler(FileUploadHandler):
+    """Принимает загрузки потоком и приводит картинки к разумному размеру.
+
+    Файл больше UPLOAD_MAX_BYTES перестаёт приниматься на первом же
+    лишнем куске и заменяется RejectedUpload. JPEG и PNG уменьшаются до
+    UPLOAD_IMAGE_MAX_SIZE по большей стороне и сохраняются без EXIF,
+    поэтому миниатюры потом не декодируют исходник с камеры. Файлы,
+    которые Pillow не читает, передаются форме как есть: её ImageField
+    их отвергнет.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = spooled_file()
+        self.size = 0
+        self.error = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.error:
+            return None
+        self.size += len(raw_data)
+        if self.size > settings.UPLOAD_MAX_BYTES:
+            self.error = (
+                f'Файл больше {filesizeformat(settings.UPLOAD_MAX_BYTES)}.'
+            )
+            self.file.close()
+            return None
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.error:
+            return self.rejected(self.error)
+        self.file.seek(0)
+        try:
+            normalized = normalize_image(self.file)
+        except ImageTooLarge as error:
+            self.file.close()
+            return self.rejected(str(error))
+        except Exception:
+            logger.info('Не удалось прочитать картинку %s', self.file_name)
+            normalized = None
+        if normalized is None:
+            normalized = self.file
+        else:
+            self.file.close()
+        size = normalized.seek(0, os.SEEK_END)
+        normalized.seek(0)
+        return UploadedFile(
+            normalized,
+            self.file_name,
+            self.content_type,
+            size,
+            self.charset,
+            self.content_type_extra,
+        )
+
+    def rejected(self, error):
+        return RejectedUpload(self.file_name, self.content_type, error)
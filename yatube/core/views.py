@@ -1,5 +1,12 @@
+import hmac
+
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
 from django.shortcuts import render
 
+from .metrics import REGISTRY
+
 
 def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
@@ -15,3 +22,29 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def metrics_allowed(request):
+    """Запрос с токеном METRICS_TOKEN или с адреса METRICS_ALLOWED_IPS.
+
+    Токен передаётся как Authorization: Bearer <токен> (bearer_token в
+    настройках Prometheus). Адресу стоит доверять, только если /metrics
+    не проксируется: за прокси на той же машине все запросы приходят
+    с 127.0.0.1.
+    """
+    token = settings.METRICS_TOKEN
+    if token:
+        expected = f'Bearer {token}'.encode()
+        given = request.META.get('HTTP_AUTHORIZATION', '').encode()
+        if hmac.compare_digest(given, expected):
+            return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    """Метрики всех воркеров в текстовом формате Prometheus."""
+    if not metrics_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(
+        REGISTRY.expose(), content_type='text/plain; version=0.0.4'
+    )
@@ -1,6 +1,17 @@
 from django.contrib import admin
 
+from . import search
+from .counters import ALL
 from .models import Comment, Follow, Group, Post
+from .paginators import CountedPaginator
+
+
+class PostAdminPaginator(CountedPaginator):
+    """Без фильтров и поиска число постов берётся из PostCount."""
+
+    def __init__(self, object_list, *args, **kwargs):
+        scope = None if object_list.query.where else ALL
+        super().__init__(object_list, *args, scope=scope, **kwargs)
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -9,6 +20,15 @@ class PostAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
+    paginator = PostAdminPaginator
+    # Иначе список выполняет ещё и COUNT(*) по всей таблице.
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE '%...%'.
+        if not search_term:
+            return queryset, False
+        return search.filter_posts(queryset, search_term), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -22,6 +42,11 @@ class CommentAdmin(admin.ModelAdmin):
     search_fields = ('text',)
     list_filter = ('author',)
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.filter_comments(queryset, search_term), False
+
 
 class FollowAdmin(admin.ModelAdmin):
     list_display = ('user', 'author')
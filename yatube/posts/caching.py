@@ -0,0 +1,111 @@
+import time
+
+from django.core.cache import cache
+
+from .models import Group, Post, User
+from .paginators import page_key
+
+INDEX = 'index'
+GROUP = 'group'
+PROFILE = 'profile'
+
+
+def _version_key(kind, pk):
+    return f'feed-version:{kind}:{pk}'
+
+
+def feed_version(kind, pk=''):
+    """Текущая версия закешированных страниц ленты.
+
+    Версия входит в ключи кеша ленты, поэтому её смена делает все старые
+    записи недостижимыми. Начальное значение берётся от времени, чтобы
+    после вытеснения счётчика из кеша не вернуться к уже занятой версии.
+    """
+    key = _version_key(kind, pk)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_feed_version(kind, pk=''):
+    key = _version_key(kind, pk)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, time.time_ns(), None)
+
+
+def bump_post_feeds(author_id, *group_ids):
+    """Сбрасывает кеш главной, профиля автора и страниц групп поста."""
+    bump_feed_version(INDEX)
+    bump_feed_version(PROFILE, author_id)
+    for group_id in set(group_ids) - {None}:
+        bump_feed_version(GROUP, group_id)
+
+
+def index_vary_on(request):
+    """Часть ключа кеша главной страницы: страница ленты."""
+    return page_key(request)
+
+
+def index_version(request):
+    return feed_version(INDEX)
+
+
+# Версии страниц для core.decorators.conditional: строка, которая
+# меняется вместе с содержимым страницы. Каждая — один запрос по
+# первичному или уникальному ключу плюс версия ленты из кеша. Версии
+# лент сбрасываются при создании, изменении и удалении постов и
+# комментариев, подписках и готовности миниатюр, поэтому отдельное
+# время изменения страницам не нужно.
+
+
+def group_state(request, slug):
+    group = (
+        Group.objects.filter(slug=slug)
+        .values_list('pk', 'title', 'description')
+        .first()
+    )
+    if group is None:
+        return None
+    pk, title, description = group
+    return f'{feed_version(GROUP, pk)}|{title}|{description}'
+
+
+def profile_state(request, username):
+    author = (
+        User.objects.filter(username=username)
+        .values_list(
+            'pk',
+            'first_name',
+            'last_name',
+            'stats__post_count',
+            'stats__follower_count',
+            'stats__following_count',
+        )
+        .first()
+    )
+    if author is None:
+        return None
+    return '|'.join(map(str, [feed_version(PROFILE, author[0]), *author]))
+
+
+def post_state(request, post_id):
+    post = (
+        Post.objects.filter(pk=post_id)
+        .values_list(
+            'author_id',
+            'updated_at',
+            'comment_count',
+            'author__stats__post_count',
+            'group__title',
+        )
+        .first()
+    )
+    if post is None:
+        return None
+    # Комментарии меняют версию ленты автора поста (bump_post_feeds).
+    author_id, *fields = post
+    return '|'.join(map(str, [feed_version(PROFILE, author_id), *fields]))
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from core.metrics import CACHE_REQUESTS
+from core.thumbnails import track_deferred
+
+from .consts import CARD_CACHE_TIMEOUT
+from .thumbnails import prefetch_thumbnails
+
+CARD_TEMPLATE = 'includes/posts_rendering.html'
+
+
+def card_key(post, show_group_link):
+    # updated_at меняется при каждом сохранении поста, поэтому
+    # устаревшие карточки просто перестают читаться.
+    return (
+        f'post-card:{post.pk}:{post.updated_at.timestamp()}:'
+        f'{int(bool(show_group_link))}'
+    )
+
+
+def attach_cards(posts, show_group_link=True):
+    """Добавляет постам готовую разметку карточки в атрибут card.
+
+    Карточки всей страницы читаются из кеша одним get_many, шаблон
+    рендерится только для отсутствующих, а их миниатюры заранее
+    находятся одним запросом (prefetch_thumbnails).
+    """
+    keys = {card_key(post, show_group_link): post for post in posts}
+    cards = cache.get_many(keys)
+    CACHE_REQUESTS.inc(len(cards), cache='post_card', result='hit')
+    CACHE_REQUESTS.inc(
+        len(keys) - len(cards), cache='post_card', result='miss'
+    )
+    missing = {}
+    prefetch_thumbnails(
+        [post for key, post in keys.items() if key not in cards]
+    )
+    for key, post in keys.items():
+        if key in cards:
+            continue
+        with track_deferred() as deferred:
+            cards[key] = render_to_string(
+                CARD_TEMPLATE,
+                {'post': post, 'show_group_link': show_group_link},
+            )
+        # Пока миниатюра в очереди, карточка показывает исходную
+        # картинку и не кешируется.
+        if not deferred:
+            missing[key] = cards[key]
+    if missing:
+        cache.set_many(missing, CARD_CACHE_TIMEOUT)
+    for key, post in keys.items():
+        post.card = mark_safe(cards[key])
+    return posts
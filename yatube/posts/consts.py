@@ -1,3 +1,9 @@
 # my config for the project
 POSTS_NUMBERS = 10
 POST_TRUNCATE_NUMBER = 15
+# страницы лент сбрасываются сигналами, поэтому кешируются надолго
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# карточка поста привязана к его updated_at и не требует сброса
+CARD_CACHE_TIMEOUT = 60 * 60 * 24
+# сохранённое число постов ленты пересчитывается в фоне не чаще этого
+COUNT_REFRESH_INTERVAL = 60 * 10
@@ -0,0 +1,226 @@
+from datetime import timedelta
+
+from django.db import DatabaseError, connection
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.jobs import pending, task
+from core.models import MediaFile
+
+from .consts import COUNT_REFRESH_INTERVAL
+from .models import Comment, Follow, Post, PostCount, User, UserStats
+
+ALL = 'all'
+# Индекс, по статистике которого оценивается размер всей ленты.
+# Для групп и авторов sqlite_stat1 знает только среднее число постов на
+# одно значение, а пагинатор считает оценку точной — их ленты
+# обрезались бы, поэтому они считаются сразу.
+ESTIMATE_INDEX = 'post_date_idx'
+
+
+def _add(queryset, **deltas):
+    return queryset.update(
+        **{field: F(field) + delta for field, delta in deltas.items()}
+    )
+
+
+def change_user_stats(user_id, **deltas):
+    """Атомарно меняет счётчики пользователя на заданные величины.
+
+    Если строки счётчиков ещё нет, она создаётся пересчётом, который уже
+    учитывает изменение. Уменьшение без строки пропускается: пользователь
+    может удаляться вместе со своими постами и подписками.
+    """
+    if _add(UserStats.objects.filter(user_id=user_id), **deltas):
+        return
+    if all(delta < 0 for delta in deltas.values()):
+        return
+    recount_users(User.objects.filter(pk=user_id))
+
+
+def change_comment_count(post_id, delta):
+    _add(Post.objects.filter(pk=post_id), comment_count=delta)
+
+
+def _count(queryset, field):
+    """Подзапрос с числом строк queryset, ссылающихся на внешний pk."""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')})
+            .order_by()
+            .values(field)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0,
+    )
+
+
+def recount_users(users):
+    """Исправляет счётчики пользователей из выборки, возвращает их число."""
+    users = users.annotate(
+        real_posts=_count(Post.objects.all(), 'author'),
+        real_followers=_count(Follow.objects.all(), 'author'),
+        real_following=_count(Follow.objects.all(), 'user'),
+    )
+    created = [
+        UserStats(
+            user_id=user.pk,
+            post_count=user.real_posts,
+            follower_count=user.real_followers,
+            following_count=user.real_following,
+        )
+        for user in users.filter(stats__isnull=True)
+    ]
+    UserStats.objects.bulk_create(created, ignore_conflicts=True)
+    drifted = users.filter(
+        ~Q(stats__post_count=F('real_posts'))
+        | ~Q(stats__follower_count=F('real_followers'))
+        | ~Q(stats__following_count=F('real_following'))
+    )
+    stats = [
+        UserStats(
+            user_id=user.pk,
+            post_count=user.real_posts,
+            follower_count=user.real_followers,
+            following_count=user.real_following,
+        )
+        for user in drifted
+    ]
+    UserStats.objects.bulk_update(
+        stats, ['post_count', 'follower_count', 'following_count']
+    )
+    return len(created) + len(stats)
+
+
+def recount_posts(posts):
+    """Исправляет число комментариев постов из выборки."""
+    real = _count(Comment.objects.all(), 'post')
+    drifted = list(
+        posts.annotate(real_comments=real)
+        .exclude(comment_count=F('real_comments'))
+        .values_list('pk', flat=True)
+    )
+    Post.objects.filter(pk__in=drifted).update(comment_count=real)
+    return len(drifted)
+
+
+def recount_media():
+    """Исправляет число ссылок на картинки постов, возвращает число файлов.
+
+    Ссылки считает core.storage.retain и release; без них gc_media
+    удалил бы файл, который ещё показывается.
+    """
+    real = dict(
+        Post.objects.exclude(image='')
+        .order_by()
+        .values('image')
+        .annotate(total=Count('pk'))
+        .values_list('image', 'total')
+    )
+    stored = dict(MediaFile.objects.values_list('name', 'refs'))
+    fixed = 0
+    for name in real.keys() | stored.keys():
+        refs = real.get(name, 0)
+        if stored.get(name) != refs:
+            MediaFile.objects.update_or_create(
+                name=name, defaults={'refs': refs}
+            )
+            fixed += 1
+    return fixed
+
+
+def group_scope(group_id):
+    return f'group:{group_id}'
+
+
+def author_scope(author_id):
+    return f'author:{author_id}'
+
+
+def post_scopes(author_id, group_id):
+    """Ленты, в которые входит пост."""
+    scopes = [ALL, author_scope(author_id)]
+    if group_id is not None:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def change_post_counts(scopes, delta):
+    # Отсутствующие строки не создаются: их посчитает post_count.
+    _add(PostCount.objects.filter(scope__in=scopes), count=delta)
+
+
+def _scope_posts(scope):
+    if scope == ALL:
+        return Post.objects.all()
+    kind, pk = scope.split(':')
+    return Post.objects.filter(**{f'{kind}_id': pk})
+
+
+@task
+def refresh_post_count(scope):
+    """Считает посты ленты заново и сохраняет результат."""
+    count = _scope_posts(scope).count()
+    refreshed = timezone.now()
+    # Два запроса вместо транзакции update_or_create: первый просмотр
+    # номерной страницы считает ленту прямо в запросе.
+    if not PostCount.objects.filter(scope=scope).update(
+        count=count, refreshed=refreshed
+    ):
+        PostCount.objects.bulk_create(
+            [PostCount(scope=scope, count=count, refreshed=refreshed)],
+            ignore_conflicts=True,
+        )
+    return count
+
+
+def estimate_post_count(scope):
+    """Оценка числа постов по статистике ANALYZE или None.
+
+    Оценивается только вся лента (ALL).
+    """
+    if scope != ALL or connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE idx = %s',
+                [ESTIMATE_INDEX],
+            )
+            row = cursor.fetchone()
+    except DatabaseError:
+        # Таблица sqlite_stat1 появляется только после ANALYZE.
+        return None
+    if row is None:
+        return None
+    return int(row[0].split()[0])
+
+
+def refresh_later(scope):
+    """Ставит пересчёт ленты в фоновую очередь, если он ещё не стоит."""
+    key = f'refresh_post_count:{scope}'
+    if not pending([key]):
+        refresh_post_count.enqueue(scope, key=key)
+
+
+def post_count(scope):
+    """Число постов ленты без COUNT(*) на каждый запрос.
+
+    Берётся из PostCount; устаревшее значение отдаётся, пока ведётся
+    фоновый пересчёт. Для всей ленты без счётчика возвращается оценка
+    по статистике индекса, а если её нет, как и для лент групп и
+    авторов, счётчик создаётся сразу.
+    """
+    counter = PostCount.objects.filter(scope=scope).first()
+    if counter is None:
+        estimate = estimate_post_count(scope)
+        if estimate is None:
+            return refresh_post_count(scope)
+        refresh_later(scope)
+        return estimate
+    stale = timezone.now() - timedelta(seconds=COUNT_REFRESH_INTERVAL)
+    if counter.refreshed < stale:
+        refresh_later(scope)
+    return counter.count
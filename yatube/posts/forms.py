@@ -1,7 +1,11 @@
 from django import forms
 
+from .images import image_metadata
 from .models import Comment, Post
 
+# Сведения о картинке поста, у которого её нет.
+NO_IMAGE = {'width': None, 'height': None, 'byte_size': None, 'blurhash': ''}
+
 
 class PostForm(forms.ModelForm):
     class Meta:
@@ -13,6 +17,26 @@ class PostForm(forms.ModelForm):
             'group': 'Выберете группу',
         }
 
+    def clean(self):
+        cleaned_data = super().clean()
+        # Загрузку отверг core.uploads.ImageUploadHandler: вместо «это не
+        # картинка» форма показывает настоящую причину.
+        error = getattr(
+            self.files.get(self.add_prefix('image')), 'upload_error', None
+        )
+        if error:
+            self.errors.pop('image', None)
+            self.add_error('image', error)
+        return cleaned_data
+
+    def save(self, commit=True):
+        if 'image' in self.changed_data:
+            image = self.cleaned_data['image']
+            metadata = image_metadata(image) if image else NO_IMAGE
+            for name, value in metadata.items():
+                setattr(self.instance, name, value)
+        return super().save(commit)
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
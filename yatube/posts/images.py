@@ -0,0 +1,103 @@
+import math
+
+from PIL import Image
+
+# Картинка уменьшается до этого размера перед расчётом BlurHash: для
+# заглушки из 4x3 компонент больше точек не нужно.
+BLURHASH_SAMPLE = 32
+BLURHASH_COMPONENTS = (4, 3)
+BASE83 = (
+    '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    'abcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+)
+
+
+def _encode83(value, length):
+    return ''.join(
+        BASE83[value // 83 ** (length - position) % 83]
+        for position in range(1, length + 1)
+    )
+
+
+def _to_linear(value):
+    value /= 255
+    if value <= 0.04045:
+        return value / 12.92
+    return ((value + 0.055) / 1.055) ** 2.4
+
+
+def _to_srgb(value):
+    value = min(max(value, 0), 1)
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def _sign_pow(value, exponent):
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def blurhash(image, components=BLURHASH_COMPONENTS):
+    """BlurHash (https://blurha.sh) картинки PIL в режиме RGB."""
+    x_components, y_components = components
+    width, height = image.size
+    linear = [
+        tuple(_to_linear(channel) for channel in pixel)
+        for pixel in image.getdata()
+    ]
+    factors = []
+    for j in range(y_components):
+        cos_y = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            cos_x = [math.cos(math.pi * i * x / width) for x in range(width)]
+            norm = (1 if i == j == 0 else 2) / (width * height)
+            red = green = blue = 0
+            for index, (r, g, b) in enumerate(linear):
+                basis = cos_x[index % width] * cos_y[index // width]
+                red += basis * r
+                green += basis * g
+                blue += basis * b
+            factors.append((red * norm, green * norm, blue * norm))
+    dc, ac = factors[0], factors[1:]
+    result = _encode83(x_components - 1 + (y_components - 1) * 9, 1)
+    if ac:
+        actual = max(abs(value) for factor in ac for value in factor)
+        quantised = max(0, min(82, int(actual * 166 - 0.5)))
+        maximum = (quantised + 1) / 166
+    else:
+        quantised, maximum = 0, 1
+    result += _encode83(quantised, 1)
+    red, green, blue = (_to_srgb(value) for value in dc)
+    result += _encode83((red << 16) + (green << 8) + blue, 4)
+    for factor in ac:
+        red, green, blue = (
+            max(0, min(18, int(_sign_pow(value / maximum, 0.5) * 9 + 9.5)))
+            for value in factor
+        )
+        result += _encode83(red * 19 * 19 + green * 19 + blue, 2)
+    return result
+
+
+def average_color(hash_):
+    """Средний цвет картинки (#rrggbb) из её BlurHash."""
+    value = 0
+    for char in hash_[2:6]:
+        value = value * 83 + BASE83.index(char)
+    return f'#{value:06x}'
+
+
+def image_metadata(file_):
+    """Ширина, высота, размер в байтах и BlurHash файла картинки."""
+    file_.seek(0)
+    with Image.open(file_) as image:
+        width, height = image.size
+        # JPEG сразу декодируется в уменьшенном масштабе.
+        image.draft('RGB', (BLURHASH_SAMPLE, BLURHASH_SAMPLE))
+        sample = image.convert('RGB')
+    sample.thumbnail((BLURHASH_SAMPLE, BLURHASH_SAMPLE))
+    return {
+        'width': width,
+        'height': height,
+        'byte_size': file_.size,
+        'blurhash': blurhash(sample),
+    }
@@ -0,0 +1,65 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.forms import NO_IMAGE
+from posts.images import image_metadata
+from posts.models import Post
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = (
+        'Записывает размеры, вес и BlurHash картинок постов, загруженных '
+        'до появления этих полей.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько постов обновлять одним запросом.',
+        )
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        if size < 1:
+            raise CommandError('--batch-size должен быть положительным.')
+        posts = Post.objects.exclude(image='').filter(width__isnull=True)
+        last = updated = missing = 0
+        while True:
+            batch = list(
+                posts.filter(pk__gt=last).order_by('pk').only('image')[:size]
+            )
+            if not batch:
+                break
+            last = batch[-1].pk
+            # Одна картинка бывает у нескольких постов: читаем её один раз.
+            found = {}
+            changed = []
+            for post in batch:
+                name = post.image.name
+                if name not in found:
+                    try:
+                        with post.image.open('rb') as file_:
+                            found[name] = image_metadata(file_)
+                    except Exception:
+                        logger.exception('Не удалось прочитать %s', name)
+                        found[name] = None
+                if found[name] is None:
+                    missing += 1
+                    continue
+                for field, value in found[name].items():
+                    setattr(post, field, value)
+                changed.append(post)
+            Post.objects.bulk_update(changed, list(NO_IMAGE))
+            updated += len(changed)
+            self.stdout.write(f'Обновлено постов: {updated}')
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Обновлено постов: {updated}, пропущено постов с '
+                f'непрочитанной картинкой: {missing}'
+            )
+        )
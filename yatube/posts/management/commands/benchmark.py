@@ -0,0 +1,264 @@
+import json
+import math
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from io import StringIO
+from statistics import median
+
+import django
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+    teardown_test_environment,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from core.metrics import REGISTRY
+from posts.models import Group, Post, UserStats
+
+# Отдельный кеш в памяти процесса, чтобы не трогать общий файловый кеш.
+LOCAL_CACHE = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark',
+    }
+}
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, rank):
+    """Процентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет временную базу данными нескольких размеров и измеряет '
+        'задержку (p50/p95/p99), число SQL-запросов и пиковую память '
+        'основных страниц. Результаты пишутся в JSON для сравнения между '
+        'коммитами.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            default='1000,10000,100000',
+            help='Число постов в наборах данных через запятую.',
+        )
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output',
+            help='Файл результатов (по умолчанию benchmark-<коммит>.json).',
+        )
+        parser.add_argument(
+            '--cold',
+            action='store_true',
+            help='Очищать кеш перед каждым запросом.',
+        )
+        parser.add_argument(
+            '--compare',
+            help='Файл прошлого запуска: вывести изменение p95.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes: ожидаются числа через запятую.')
+        setup_test_environment()
+        # Данные заполняются во временной базе, рабочая не меняется.
+        # Кеш и метрики тоже свои: seed очищает кеш, а запросы бенчмарка
+        # не должны попадать в /metrics сервера.
+        old_config = setup_databases(verbosity=0, interactive=False)
+        directory = tempfile.TemporaryDirectory()
+        isolated = override_settings(
+            CACHES=LOCAL_CACHE,
+            METRICS_DB=os.path.join(directory.name, 'metrics.sqlite3'),
+        )
+        isolated.enable()
+        try:
+            results = []
+            for size in sizes:
+                self.seed(size, options['seed'])
+                results += self.measure(
+                    size, options['iterations'], options['cold']
+                )
+        finally:
+            REGISTRY.flush()
+            isolated.disable()
+            directory.cleanup()
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+        commit = current_commit()
+        report = {
+            'commit': commit,
+            'created': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'iterations': options['iterations'],
+            'cold': options['cold'],
+            'results': results,
+        }
+        output = options['output'] or f'benchmark-{commit or "local"}.json'
+        with open(output, 'w') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.report(results)
+        if options['compare']:
+            self.compare(options['compare'], results)
+        self.stdout.write(self.style.SUCCESS(f'Результаты: {output}'))
+
+    def seed(self, size, seed):
+        # Каждый размер заполняется с нуля.
+        call_command('flush', interactive=False, verbosity=0)
+        call_command(
+            'seed',
+            f'--posts={size}',
+            f'--users={max(size // 10, 10)}',
+            f'--groups={max(size // 1000, 3)}',
+            f'--comments={size}',
+            f'--seed={seed}',
+            stdout=StringIO(),
+        )
+
+    def requests(self):
+        """Пары (имя, функция запроса) для измерения."""
+        reader = UserStats.objects.order_by('-following_count').first().user
+        author = UserStats.objects.order_by('-post_count').first().user
+        group = (
+            Group.objects.annotate(total=Count('posts'))
+            .order_by('-total')
+            .first()
+        )
+        post = Post.objects.order_by('-comment_count', '-pk').first()
+        client = Client()
+        client.force_login(reader)
+        comment_url = reverse('posts:add_comment', args=(post.pk,))
+        return [
+            ('index', lambda: Client().get(reverse('posts:index'))),
+            (
+                'group_posts',
+                lambda: client.get(
+                    reverse('posts:group_list', args=(group.slug,))
+                ),
+            ),
+            (
+                'profile',
+                lambda: client.get(
+                    reverse('posts:profile', args=(author.username,))
+                ),
+            ),
+            (
+                'post_detail',
+                lambda: client.get(
+                    reverse('posts:post_detail', args=(post.pk,))
+                ),
+            ),
+            (
+                'follow_index',
+                lambda: client.get(reverse('posts:follow_index')),
+            ),
+            (
+                'post_create',
+                lambda: client.post(
+                    reverse('posts:create'),
+                    {'text': 'Пост из бенчмарка', 'group': group.pk},
+                ),
+            ),
+            (
+                'add_comment',
+                lambda: client.post(comment_url, {'text': 'Комментарий'}),
+            ),
+        ]
+
+    def measure(self, size, iterations, cold=False):
+        results = []
+        cache.clear()
+        for name, request in self.requests():
+            timings = []
+            queries = []
+            for _ in range(iterations):
+                if cold:
+                    cache.clear()
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    response = request()
+                    timings.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    raise CommandError(f'{name}: ответ {response.status_code}')
+                queries.append(len(captured.captured_queries))
+            # Трассировка памяти замедляет код, поэтому память
+            # измеряется отдельным запросом.
+            tracemalloc.start()
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result = {
+                'size': size,
+                'view': name,
+                'queries': median(queries),
+                'peak_memory_kb': round(peak / 1024, 1),
+            }
+            for rank in PERCENTILES:
+                result[f'p{rank}_ms'] = round(
+                    percentile(timings, rank) * 1000, 3
+                )
+            results.append(result)
+        return results
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"size":>8} {"view":<14} {"p50":>9} {"p95":>9} {"p99":>9} '
+            f'{"queries":>8} {"memory":>10}'
+        )
+        for row in results:
+            self.stdout.write(
+                f'{row["size"]:>8} {row["view"]:<14} '
+                f'{row["p50_ms"]:>7.2f}ms {row["p95_ms"]:>7.2f}ms '
+                f'{row["p99_ms"]:>7.2f}ms {row["queries"]:>8} '
+                f'{row["peak_memory_kb"]:>8.0f}KB'
+            )
+
+    def compare(self, path, results):
+        with open(path) as file:
+            previous = {
+                (row['size'], row['view']): row
+                for row in json.load(file)['results']
+            }
+        for row in results:
+            old = previous.get((row['size'], row['view']))
+            if old is None:
+                continue
+            change = (row['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100
+            self.stdout.write(
+                f'{row["size"]:>8} {row["view"]:<14} p95 '
+                f'{old["p95_ms"]:.2f} -> {row["p95_ms"]:.2f}ms '
+                f'({change:+.0f}%), '
+                f'запросов {old["queries"]} -> {row["queries"]}'
+            )
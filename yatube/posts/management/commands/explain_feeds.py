@@ -0,0 +1,98 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts import views
+from posts.models import Follow, Post
+from posts.paginators import CursorPaginator
+
+FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(.*)$')
+NOT_TABLES = ('CONSTANT', 'SUBQUERY')
+TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (RIGHT PART OF )?ORDER BY')
+DUMMY_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет EXPLAIN QUERY PLAN для всех запросов лент и страницы поста '
+        'и завершается ошибкой, если запрос читает таблицу целиком или '
+        'сортирует результат во временном B-дереве.'
+    )
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Команда поддерживает только SQLite.')
+        problems = []
+        with override_settings(CACHES=DUMMY_CACHE):
+            for name, request, view, kwargs in self.get_requests():
+                with CaptureQueriesContext(connection) as queries:
+                    view(request, **kwargs)
+                for query in queries.captured_queries:
+                    problems += self.check_query(name, query['sql'])
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Все планы запросов в порядке.'))
+
+    def check_query(self, name, sql):
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            plan = [row[-1] for row in cursor.fetchall()]
+        self.stdout.write(f'{name}: {sql}')
+        for line in plan:
+            self.stdout.write(f'    {line}')
+        return [
+            f'{name}: {line}\n    {sql}'
+            for line in plan
+            if self.is_full_scan(line) or TEMP_SORT.search(line)
+        ]
+
+    @staticmethod
+    def is_full_scan(line):
+        match = FULL_SCAN.match(line.strip())
+        return bool(
+            match
+            and match.group(1) not in NOT_TABLES
+            and 'USING' not in match.group(2)
+        )
+
+    def get_requests(self):
+        """Запросы к представлениям на первую и следующую страницы лент."""
+        factory = RequestFactory()
+        post = Post.objects.select_related('author', 'group').first()
+        if post is None:
+            raise CommandError('В базе нет постов для проверки.')
+        cursor = CursorPaginator(Post.objects.none(), 1).encode_cursor(post)
+        pages = {'first': {}, 'after': {'after': cursor}}
+        feeds = [
+            ('index', views.index, {}),
+            ('profile', views.profile, {'username': post.author.username}),
+        ]
+        if post.group is not None:
+            feeds.append(
+                ('group_list', views.group_posts, {'slug': post.group.slug})
+            )
+        follow = Follow.objects.select_related('user').first()
+        if follow is not None:
+            feeds.append(('follow_index', views.follow_index, {}))
+        else:
+            self.stderr.write('Нет подписок, follow_index пропущен.')
+        for url_name, view, kwargs in feeds:
+            for page, params in pages.items():
+                request = factory.get(
+                    reverse(f'posts:{url_name}', kwargs=kwargs), params
+                )
+                request.user = follow.user if follow else post.author
+                yield f'{url_name} ({page})', request, view, kwargs
+        request = factory.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.id})
+        )
+        request.user = post.author
+        yield 'post_detail', request, views.post_detail, {'post_id': post.id}
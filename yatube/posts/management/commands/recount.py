@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Post, PostCount, User
+
+
+class Command(BaseCommand):
+    help = (
+        'Исправляет расхождения в счётчиках постов, пользователей, лент '
+        'и ссылок на картинки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько строк проверять за один проход.',
+        )
+
+    def batches(self, queryset, size):
+        """Выборки по size строк, идущие по первичному ключу."""
+        last = 0
+        while True:
+            ids = list(
+                queryset.filter(pk__gt=last)
+                .order_by('pk')
+                .values_list('pk', flat=True)[:size]
+            )
+            if not ids:
+                return
+            last = ids[-1]
+            yield queryset.filter(pk__in=ids)
+
+    def handle(self, *args, **options):
+        size = options['batch_size']
+        users = sum(
+            counters.recount_users(batch)
+            for batch in self.batches(User.objects.all(), size)
+        )
+        posts = sum(
+            counters.recount_posts(batch)
+            for batch in self.batches(Post.objects.all(), size)
+        )
+        media = counters.recount_media()
+        scopes = list(PostCount.objects.values_list('scope', flat=True))
+        for scope in scopes:
+            counters.refresh_post_count(scope)
+        self.stdout.write(
+            f'Исправлено счётчиков: пользователей {users}, постов {posts}, '
+            f'картинок {media}. '
+            f'Пересчитано лент: {len(scopes)}'
+        )
@@ -0,0 +1,288 @@
+import bisect
+import itertools
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from faker import Faker
+
+from posts import search
+from posts.models import Comment, Follow, Group, Post, User
+
+# Тексты генерируются заранее: Faker на каждую из миллионов строк
+# работал бы дольше самой вставки.
+TEXT_POOL_SIZE = 5000
+# Период, по которому распределяются даты постов и комментариев.
+HISTORY_DAYS = 365 * 3
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу случайными пользователями, группами, постами, '
+        'комментариями и подписками. Результат зависит только от --seed. '
+        'Посты, комментарии и подписки пишутся напрямую через '
+        'executemany: построение SQL в bulk_create на миллионах строк '
+        'дольше самой вставки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument(
+            '--follows',
+            type=int,
+            default=20,
+            help='Среднее число подписок на пользователя.',
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.1,
+            help='Показатель степенного закона активности авторов.',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--no-timelines',
+            action='store_true',
+            help='Не собирать ленты подписок (долго на больших данных).',
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.faker = Faker('ru_RU')
+        self.faker.seed_instance(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        # Время переводится в формат столбцов базы один раз, а не для
+        # каждой строки.
+        self.db_now = parse_datetime(
+            connection.ops.adapt_datetimefield_value(self.now)
+        )
+        texts = [
+            self.faker.paragraph(nb_sentences=self.random.randint(1, 6))
+            for _ in range(TEXT_POOL_SIZE)
+        ]
+        with search.bulk_load(connection), transaction.atomic():
+            users = self.create_users(options['users'])
+            groups = self.create_groups(options['groups'])
+            # Вес автора убывает по степенному закону от его номера:
+            # немногие пишут большую часть постов.
+            weights = list(
+                itertools.accumulate(
+                    1 / rank ** options['skew']
+                    for rank in range(1, len(users) + 1)
+                )
+            )
+            posts = self.create_posts(
+                options['posts'], users, groups, weights, texts
+            )
+            self.create_comments(options['comments'], users, posts, texts)
+            self.create_follows(options['follows'], users, weights)
+        call_command('recount', stdout=self.stdout)
+        if not options['no_timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
+        # Закешированные ленты и счётчики версий не знают о новых данных.
+        cache.clear()
+
+    def weighted(self, items, weights):
+        point = self.random.random() * weights[-1]
+        return items[bisect.bisect(weights, point)]
+
+    def moment(self):
+        return self.now - timedelta(
+            seconds=self.random.randrange(HISTORY_DAYS * 24 * 60 * 60)
+        )
+
+    def db_moment(self):
+        """Случайная дата в формате столбца DateTimeField."""
+        return str(
+            self.db_now
+            - timedelta(
+                seconds=self.random.randrange(HISTORY_DAYS * 24 * 60 * 60)
+            )
+        )
+
+    def new_ids(self, model, before):
+        """id строк, вставленных после строки before.
+
+        Автоинкремент SQLite выдаёт их подряд, поэтому возвращается
+        диапазон, а не список из миллионов чисел. Начало читается из
+        базы: id удалённых строк не переиспользуются.
+        """
+        ids = model.objects.filter(pk__gt=before).aggregate(
+            first=Min('pk'), last=Max('pk')
+        )
+        if ids['first'] is None:
+            return range(0)
+        return range(ids['first'], ids['last'] + 1)
+
+    def insert(self, model, objects, total, **kwargs):
+        """Вставляет объекты пачками и возвращает id новых строк."""
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        objects = iter(objects)
+        done = 0
+        while True:
+            batch = list(itertools.islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch, **kwargs)
+            done += len(batch)
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}: {done}/{total}'
+            )
+        return self.new_ids(model, before)
+
+    def insert_rows(self, model, fields, rows, total, ignore=False):
+        """Вставляет кортежи значений полей fields пачками.
+
+        Возвращает id новых строк, как insert.
+        """
+        quote = connection.ops.quote_name
+        columns = ', '.join(
+            quote(model._meta.get_field(name).column) for name in fields
+        )
+        placeholders = ', '.join(['%s'] * len(fields))
+        sql = (
+            f'INSERT {"OR IGNORE " if ignore else ""}'
+            f'INTO {quote(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders})'
+        )
+        before = model.objects.aggregate(last=Max('pk'))['last'] or 0
+        rows = iter(rows)
+        done = 0
+        with connection.cursor() as cursor:
+            while True:
+                batch = list(itertools.islice(rows, self.batch_size))
+                if not batch:
+                    break
+                cursor.executemany(sql, batch)
+                done += len(batch)
+                self.stdout.write(
+                    f'{model._meta.verbose_name_plural}: {done}/{total}'
+                )
+        return self.new_ids(model, before)
+
+    def create_users(self, count):
+        password = make_password(None)
+        return self.insert(
+            User,
+            (
+                User(
+                    username=f'{self.faker.user_name()}{number}',
+                    first_name=self.faker.first_name(),
+                    last_name=self.faker.last_name(),
+                    email=self.faker.email(),
+                    password=password,
+                    date_joined=self.moment(),
+                )
+                for number in range(count)
+            ),
+            count,
+        )
+
+    def create_groups(self, count):
+        return self.insert(
+            Group,
+            (
+                Group(
+                    title=self.faker.catch_phrase()[:200],
+                    slug=f'{self.faker.slug()}-{number}',
+                    description=self.faker.paragraph(),
+                )
+                for number in range(count)
+            ),
+            count,
+        )
+
+    def create_posts(self, count, users, groups, weights, texts):
+        def rows():
+            for _ in range(count):
+                date = self.db_moment()
+                has_group = groups and self.random.random() < 0.5
+                yield (
+                    self.random.choice(texts),
+                    self.weighted(users, weights),
+                    self.random.choice(groups) if has_group else None,
+                    date,
+                    date,
+                    '',
+                    '',
+                    0,
+                )
+
+        return self.insert_rows(
+            Post,
+            (
+                'text',
+                'author',
+                'group',
+                'pub_date',
+                'updated_at',
+                'image',
+                'blurhash',
+                'comment_count',
+            ),
+            rows(),
+            count,
+        )
+
+    def create_comments(self, count, users, posts, texts):
+        if not posts:
+            return
+        self.insert_rows(
+            Comment,
+            ('post', 'author', 'text', 'created'),
+            (
+                (
+                    self.random.choice(posts),
+                    self.random.choice(users),
+                    self.random.choice(texts),
+                    self.db_moment(),
+                )
+                for _ in range(count)
+            ),
+            count,
+        )
+
+    def create_follows(self, average, users, weights):
+        """Подписки со степенным распределением.
+
+        Число подписок пользователя экспоненциально, а авторов выбирают
+        пропорционально их активности, поэтому у немногих авторов
+        большинство подписчиков.
+        """
+
+        def rows():
+            for user in users:
+                amount = min(
+                    int(self.random.expovariate(1 / average)), len(users) - 1
+                )
+                authors = set()
+                # Редких авторов можно выбирать долго — число попыток
+                # ограничено.
+                for _ in range(amount * 10):
+                    if len(authors) >= amount:
+                        break
+                    author = self.weighted(users, weights)
+                    if author != user:
+                        authors.add(author)
+                for author in sorted(authors):
+                    yield user, author
+
+        self.insert_rows(
+            Follow,
+            ('user', 'author'),
+            rows(),
+            len(users) * average,
+            ignore=True,
+        )
@@ -0,0 +1,98 @@
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.thumbnails import thumbnail_generated
+
+from posts.models import Post
+from posts.thumbnails import SPECS
+
+logger = logging.getLogger(__name__)
+
+
+def warm(names, spec_names):
+    """Создаёт миниатюры картинок и возвращает число ошибок.
+
+    Как и задача generate_thumbnail, после миниатюр картинки отправляет
+    thumbnail_generated: закешированные ленты с исходной картинкой
+    вместо миниатюры сбрасываются.
+    """
+    errors = 0
+    for name in names:
+        for spec_name in spec_names:
+            try:
+                SPECS[spec_name].generate(name)
+            except Exception:
+                logger.exception('Не удалось создать миниатюру %s', name)
+                errors += 1
+        thumbnail_generated.send(sender=None, name=name)
+    return errors
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт миниатюры (posts.thumbnails.SPECS) всех картинок постов '
+        'в пуле процессов. Уже созданные миниатюры пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов; 1 — без пула, в текущем процессе.',
+        )
+        parser.add_argument('--chunk-size', type=int, default=50)
+        parser.add_argument(
+            '--spec',
+            action='append',
+            choices=sorted(SPECS),
+            help='Только эти миниатюры (по умолчанию все).',
+        )
+
+    def handle(self, *args, **options):
+        spec_names = options['spec'] or list(SPECS)
+        names = list(
+            Post.objects.exclude(image='')
+            .order_by()
+            .values_list('image', flat=True)
+            .distinct()
+        )
+        size = options['chunk_size']
+        if size < 1:
+            raise CommandError('--chunk-size должен быть положительным.')
+        chunks = [names[i:i + size] for i in range(0, len(names), size)]
+        if options['processes'] == 1:
+            errors = self.collect(
+                chunks, (warm(chunk, spec_names) for chunk in chunks)
+            )
+        else:
+            # Дочерние процессы открывают свои соединения с базой.
+            connections.close_all()
+            with ProcessPoolExecutor(
+                options['processes'],
+                mp_context=multiprocessing.get_context('fork'),
+            ) as pool:
+                errors = self.collect(
+                    chunks,
+                    pool.map(warm, chunks, [spec_names] * len(chunks)),
+                )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Картинок: {len(names)}, видов миниатюр: '
+                f'{len(spec_names)}, ошибок: {errors}'
+            )
+        )
+
+    def collect(self, chunks, results):
+        total = sum(len(chunk) for chunk in chunks)
+        done = errors = 0
+        for chunk, chunk_errors in zip(chunks, results):
+            done += len(chunk)
+            errors += chunk_errors
+            self.stdout.write(f'Картинок: {done}/{total}')
+        return errors
@@ -0,0 +1,66 @@
+# Generated by Django 2.2.16 on 2026-10-17 04:46
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.utils import timezone
+
+
+def fill_post_counts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    PostCount = apps.get_model('posts', 'PostCount')
+    now = timezone.now()
+    total = Post.objects.count()
+    if not total:
+        # Пустую таблицу PostCount заполнит при первом чтении.
+        return
+    counts = [PostCount(scope='all', count=total, refreshed=now)]
+    for kind in ('author', 'group'):
+        rows = (
+            Post.objects.filter(**{f'{kind}__isnull': False})
+            .order_by()
+            .values_list(f'{kind}_id')
+            .annotate(total=Count('pk'))
+        )
+        counts.extend(
+            PostCount(scope=f'{kind}:{pk}', count=total, refreshed=now)
+            for pk, total in rows
+        )
+    PostCount.objects.bulk_create(counts, batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('posts', '0012_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostCount',
+            fields=[
+                (
+                    'scope',
+                    models.CharField(
+                        max_length=50,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name='Лента',
+                    ),
+                ),
+                (
+                    'count',
+                    models.PositiveIntegerField(
+                        default=0, verbose_name='Число постов'
+                    ),
+                ),
+                (
+                    'refreshed',
+                    models.DateTimeField(verbose_name='Пересчитано'),
+                ),
+            ],
+            options={
+                'verbose_name': 'Число постов ленты',
+                'verbose_name_plural': 'Числа постов лент',
+            },
+        ),
+        migrations.RunPython(fill_post_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+# Триггеры, которые поддерживают индексы, создаёт posts.search после
+# каждой миграции (сигнал post_migrate).
+CREATE_INDEXES = [
+    """
+    CREATE VIRTUAL TABLE posts_post_fts USING fts5(
+        text,
+        content='posts_post',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    "INSERT INTO posts_post_fts (posts_post_fts) VALUES ('rebuild')",
+    """
+    CREATE VIRTUAL TABLE posts_comment_fts USING fts5(
+        text,
+        content='posts_comment',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    "INSERT INTO posts_comment_fts (posts_comment_fts) VALUES ('rebuild')",
+]
+DROP_INDEXES = [
+    f'DROP TRIGGER IF EXISTS {index}_{action}'
+    for index in ('posts_post_fts', 'posts_comment_fts')
+    for action in ('insert', 'delete', 'update')
+] + [
+    'DROP TABLE IF EXISTS posts_post_fts',
+    'DROP TABLE IF EXISTS posts_comment_fts',
+]
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('posts', '0013_post_counts'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE_INDEXES, DROP_INDEXES),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 2.2.16 on 2026-10-17 05:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ('posts', '0014_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='blurhash',
+            field=models.CharField(
+                blank=True,
+                editable=False,
+                max_length=64,
+                verbose_name='BlurHash картинки',
+            ),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='byte_size',
+            field=models.PositiveIntegerField(
+                editable=False,
+                null=True,
+                verbose_name='Размер картинки в байтах',
+            ),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='height',
+            field=models.PositiveIntegerField(
+                editable=False, null=True, verbose_name='Высота картинки'
+            ),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='width',
+            field=models.PositiveIntegerField(
+                editable=False, null=True, verbose_name='Ширина картинки'
+            ),
+        ),
+    ]
@@ -35,15 +35,58 @@ class Post(models.Model):
         help_text='Выберите группу',
     )
     image = models.ImageField('Картинка', upload_to='posts/', blank=True)
+    # Сведения о картинке записываются при загрузке (PostForm.save), чтобы
+    # при выводе поста не открывать файл.
+    width = models.PositiveIntegerField(
+        'Ширина картинки', null=True, editable=False
+    )
+    height = models.PositiveIntegerField(
+        'Высота картинки', null=True, editable=False
+    )
+    byte_size = models.PositiveIntegerField(
+        'Размер картинки в байтах', null=True, editable=False
+    )
+    blurhash = models.CharField(
+        'BlurHash картинки', max_length=64, blank=True, editable=False
+    )
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
+    comment_count = models.PositiveIntegerField(
+        'Число комментариев', default=0, editable=False
+    )
 
     class Meta:
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', '-id']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'], name='post_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx',
+            ),
+            # Посты с картинкой: сброс лент после создания миниатюры
+            # (posts.signals.thumbnail_ready).
+            models.Index(fields=['image'], name='post_image_idx'),
+        ]
 
     def __str__(self):
         return self.text[:POST_TRUNCATE_NUMBER]
 
+    def save(self, *args, **kwargs):
+        # comment_count меняется только через F(): сохранение целиком
+        # затёрло бы комментарии, добавленные после загрузки поста.
+        if not self._state.adding and 'update_fields' not in kwargs:
+            kwargs['update_fields'] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'comment_count'
+            ]
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -65,6 +108,15 @@ class Comment(models.Model):
         'Дата публикации комментария', auto_now_add=True
     )
 
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [
+            models.Index(
+                fields=['post', 'created', 'id'],
+                name='comment_post_created_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.text[:POST_TRUNCATE_NUMBER]
 
@@ -88,3 +140,90 @@ class Follow(models.Model):
             CheckConstraint(name='not_same', check=~Q(user=F('author'))),
             UniqueConstraint(fields=['user', 'author'], name='unique_pair'),
         ]
+        indexes = [
+            models.Index(
+                fields=['author', 'user'], name='follow_author_user_idx'
+            ),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя.
+
+    Заполняется при публикации поста (fan-out on write), поэтому чтение
+    ленты — это один диапазонный проход по индексу (user, pub_date).
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date', '-post_id']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_date_idx',
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые дорого считать на каждый запрос.
+
+    Поддерживаются сигналами через F()-выражения, расхождения
+    исправляет команда recount.
+    """
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Пользователь',
+    )
+    post_count = models.PositiveIntegerField('Число постов', default=0)
+    follower_count = models.PositiveIntegerField(
+        'Число подписчиков', default=0
+    )
+    following_count = models.PositiveIntegerField('Число подписок', default=0)
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+
+class PostCount(models.Model):
+    """Число постов ленты: всего, в группе или у автора.
+
+    Заменяет COUNT(*) при постраничном выводе. Поддерживается сигналами
+    и периодически пересчитывается, см. posts.counters.
+    """
+
+    scope = models.CharField('Лента', max_length=50, primary_key=True)
+    count = models.PositiveIntegerField('Число постов', default=0)
+    refreshed = models.DateTimeField('Пересчитано')
+
+    class Meta:
+        verbose_name = 'Число постов ленты'
+        verbose_name_plural = 'Числа постов лент'
+
+    def __str__(self):
+        return f'{self.scope}: {self.count}'
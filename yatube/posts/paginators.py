@@ -0,0 +1,157 @@
+import base64
+
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+from . import counters
+from .consts import POSTS_NUMBERS
+
+PAGE_PARAMS = ('page', 'after', 'before')
+
+
+class CursorPaginator(Paginator):
+    """Постраничный вывод по ключу (pub_date, id) без COUNT и OFFSET.
+
+    Страница выбирается условием на ключ последней (или первой) записи
+    предыдущей страницы, поэтому стоимость переходов не зависит от
+    глубины ленты. Общее количество записей и номера страниц неизвестны.
+    """
+
+    is_cursor = True
+
+    def __init__(self, object_list, per_page, key=('pub_date', 'id')):
+        super().__init__(object_list, per_page)
+        self.key = key
+        self.has_next = False
+        self.has_previous = False
+        self.next_cursor = None
+        self.previous_cursor = None
+
+    def encode_cursor(self, obj):
+        date, pk = (getattr(obj, field) for field in self.key)
+        raw = f'{date.isoformat()}|{pk}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode()).decode()
+            date, pk = raw.split('|')
+            date = parse_datetime(date)
+            pk = int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError):
+            return None
+        if date is None:
+            return None
+        return date, pk
+
+    def keyset(self, cursor, direction):
+        """Условие «строго после/до курсора» в порядке ленты."""
+        date, pk = cursor
+        date_field, pk_field = self.key
+        return Q(**{f'{date_field}__{direction}': date}) | Q(
+            **{date_field: date, f'{pk_field}__{direction}': pk}
+        )
+
+    def ordered(self, descending=True):
+        prefix = '-' if descending else ''
+        return self.object_list.order_by(
+            *(f'{prefix}{field}' for field in self.key)
+        )
+
+    def get_page(self, after=None, before=None):
+        """Возвращает страницу, следующую за after или предшествующую before.
+
+        Некорректный курсор, как и в Paginator.get_page, даёт первую
+        страницу.
+        """
+        if after and self.decode_cursor(after):
+            return self._page_after(self.decode_cursor(after))
+        if before and self.decode_cursor(before):
+            page = self._page_before(self.decode_cursor(before))
+            if page is not None:
+                return page
+        return self._first_page()
+
+    def _first_page(self):
+        rows = list(self.ordered()[:self.per_page + 1])
+        return self._build(rows, has_previous=False)
+
+    def _page_after(self, cursor):
+        queryset = self.ordered().filter(self.keyset(cursor, 'lt'))
+        rows = list(queryset[:self.per_page + 1])
+        return self._build(rows, has_previous=True)
+
+    def _page_before(self, cursor):
+        queryset = self.ordered(descending=False).filter(
+            self.keyset(cursor, 'gt')
+        )
+        rows = list(queryset[:self.per_page + 1])
+        if len(rows) <= self.per_page:
+            # До начала ленты меньше полной страницы — это первая страница.
+            return None
+        rows = rows[:self.per_page]
+        rows.reverse()
+        self.has_next = True
+        self.has_previous = True
+        self.next_cursor = self.encode_cursor(rows[-1])
+        self.previous_cursor = self.encode_cursor(rows[0])
+        return Page(rows, 1, self)
+
+    def _build(self, rows, has_previous):
+        self.has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        self.has_previous = has_previous and bool(rows)
+        if self.has_next:
+            self.next_cursor = self.encode_cursor(rows[-1])
+        if self.has_previous:
+            self.previous_cursor = self.encode_cursor(rows[0])
+        return Page(rows, 1, self)
+
+
+class CountedPaginator(Paginator):
+    """Paginator, берущий число постов из PostCount вместо COUNT(*).
+
+    scope — лента в терминах posts.counters; без него считается как
+    обычно.
+    """
+
+    def __init__(self, object_list, per_page, *args, scope=None, **kwargs):
+        super().__init__(object_list, per_page, *args, **kwargs)
+        self.scope = scope
+
+    @cached_property
+    def count(self):
+        if self.scope is None:
+            return super().count
+        return counters.post_count(self.scope)
+
+
+def paginate(
+    request, object_list, per_page=POSTS_NUMBERS, count_scope=None, **kwargs
+):
+    """Страница ленты для запроса.
+
+    По умолчанию используется курсорный режим (?after=/?before=),
+    старые ссылки вида ?page=N обслуживаются CountedPaginator.
+    """
+    if 'page' in request.GET:
+        paginator = CountedPaginator(
+            object_list, per_page, scope=count_scope
+        )
+        return paginator.get_page(request.GET.get('page'))
+    paginator = CursorPaginator(object_list, per_page, **kwargs)
+    return paginator.get_page(
+        after=request.GET.get('after'), before=request.GET.get('before')
+    )
+
+
+def page_key(request):
+    """Параметры страницы ленты из запроса — часть ключа кеша."""
+    return '&'.join(
+        f'{name}={request.GET[name]}'
+        for name in PAGE_PARAMS
+        if name in request.GET
+    )
@@ -0,0 +1,159 @@
+import re
+from contextlib import contextmanager
+
+from django.db import connection
+
+from .models import Post
+
+# Индексы FTS5 хранят только словарь, сам текст читается из таблиц
+# posts_post и posts_comment (external content).
+INDEXES = {
+    'posts_post_fts': 'posts_post',
+    'posts_comment_fts': 'posts_comment',
+}
+TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table}
+    BEGIN
+        INSERT INTO {index} (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table}
+    BEGIN
+        INSERT INTO {index} ({index}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS {index}_update
+    AFTER UPDATE OF text ON {table}
+    BEGIN
+        INSERT INTO {index} ({index}, rowid, text)
+        VALUES ('delete', old.id, old.text);
+        INSERT INTO {index} (rowid, text) VALUES (new.id, new.text);
+    END
+    """,
+)
+POST_MATCHES = 'SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s'
+COMMENT_MATCHES = (
+    'SELECT rowid FROM posts_comment_fts WHERE posts_comment_fts MATCH %s'
+)
+# Пост находится по своему тексту или тексту комментариев, место в
+# выдаче определяет лучшее совпадение (bm25: меньше — лучше).
+RANKED_POSTS = """
+SELECT post_id FROM (
+    SELECT rowid AS post_id, rank FROM posts_post_fts
+    WHERE posts_post_fts MATCH %s
+    UNION ALL
+    SELECT comment.post_id, posts_comment_fts.rank
+    FROM posts_comment_fts
+    JOIN posts_comment AS comment ON comment.id = posts_comment_fts.rowid
+    WHERE posts_comment_fts MATCH %s
+)
+GROUP BY post_id
+"""
+
+
+def install_triggers(connection):
+    """Создаёт триггеры, синхронизирующие индексы с таблицами.
+
+    Вызывается после каждой миграции: SQLite пересоздаёт таблицу при
+    изменении её схемы и теряет при этом триггеры.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    tables = connection.introspection.table_names()
+    with connection.cursor() as cursor:
+        for index, table in INDEXES.items():
+            if index not in tables:
+                # Миграция с индексом ещё не применена.
+                continue
+            for trigger in TRIGGERS:
+                cursor.execute(trigger.format(index=index, table=table))
+
+
+@contextmanager
+def bulk_load(connection):
+    """Отключает триггеры на время массовой загрузки.
+
+    Обновлять индекс построчно дольше, чем перестроить его целиком
+    после загрузки.
+    """
+    if connection.vendor != 'sqlite':
+        yield
+        return
+    with connection.cursor() as cursor:
+        for index in INDEXES:
+            for action in ('insert', 'delete', 'update'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS {index}_{action}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for index in INDEXES:
+                cursor.execute(
+                    f"INSERT INTO {index} ({index}) VALUES ('rebuild')"
+                )
+        install_triggers(connection)
+
+
+def match_expression(query):
+    """Запрос пользователя в синтаксисе FTS5: все слова, по началу слова.
+
+    Слова берутся в кавычки, поэтому операторы FTS5 во вводе не работают
+    и не вызывают ошибок синтаксиса.
+    """
+    return ' '.join(f'"{word}"*' for word in re.findall(r'\w+', query))
+
+
+def _filter(queryset, matches, query):
+    # pk__in=RawSQL(...) даёт «IN ((SELECT ...))», а SQLite считает
+    # подзапрос в двойных скобках скалярным и берёт только первую строку.
+    match = match_expression(query)
+    if not match:
+        return queryset.none()
+    table = connection.ops.quote_name(queryset.model._meta.db_table)
+    return queryset.extra(where=[f'{table}.id IN ({matches})'], params=[match])
+
+
+def filter_posts(queryset, query):
+    """Посты queryset, в тексте которых есть все слова запроса."""
+    return _filter(queryset, POST_MATCHES, query)
+
+
+def filter_comments(queryset, query):
+    return _filter(queryset, COMMENT_MATCHES, query)
+
+
+class SearchResults:
+    """Посты по запросу в порядке релевантности.
+
+    Поддерживает count() и срезы, поэтому передаётся в Paginator как
+    есть: индекс FTS5 читается только для запрошенной страницы.
+    """
+
+    def __init__(self, query):
+        self.match = match_expression(query)
+
+    def count(self):
+        if not self.match:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT COUNT(*) FROM ({RANKED_POSTS})', [self.match] * 2
+            )
+            return cursor.fetchone()[0]
+
+    def __getitem__(self, page):
+        if not self.match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'{RANKED_POSTS} ORDER BY MIN(rank), post_id DESC '
+                f'LIMIT %s OFFSET %s',
+                [self.match, self.match, page.stop - page.start, page.start],
+            )
+            ids = [row[0] for row in cursor.fetchall()]
+        posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
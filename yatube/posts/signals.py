@@ -0,0 +1,160 @@
+import threading
+
+from django.db import connections
+from django.db.models.signals import (
+    post_delete,
+    post_migrate,
+    post_save,
+    pre_delete,
+    pre_save,
+)
+from django.dispatch import receiver
+
+from core import storage
+from core.thumbnails import thumbnail_generated
+
+from . import caching, counters, search, thumbnails, timeline
+from .models import Comment, Follow, Post, User, UserStats
+
+_local = threading.local()
+
+
+def deleting_posts():
+    # Посты, удаляемые сейчас в этом потоке. Django удаляет
+    # комментарии каскадом раньше поста, и работу за каждый из них
+    # делать не нужно: ленты сбросит сам пост.
+    if not hasattr(_local, 'posts'):
+        _local.posts = set()
+    return _local.posts
+
+
+@receiver(pre_save, sender=Post)
+def post_remember_previous(sender, instance, **kwargs):
+    # При смене группы нужно сбросить кеш и прежней группы, а при смене
+    # картинки — перенести ссылку на файл и создать миниатюры.
+    instance._previous_group_id = None
+    instance._previous_image = None
+    if instance.pk is not None:
+        instance._previous_group_id, instance._previous_image = (
+            Post.objects.filter(pk=instance.pk)
+            .values_list('group_id', 'image')
+            .first()
+        ) or (None, None)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        timeline.fan_out(instance)
+        counters.change_user_stats(instance.author_id, post_count=1)
+        counters.change_post_counts(
+            counters.post_scopes(instance.author_id, instance.group_id), 1
+        )
+    else:
+        previous_group_id = getattr(instance, '_previous_group_id', None)
+        if previous_group_id != instance.group_id:
+            if previous_group_id is not None:
+                counters.change_post_counts(
+                    [counters.group_scope(previous_group_id)], -1
+                )
+            if instance.group_id is not None:
+                counters.change_post_counts(
+                    [counters.group_scope(instance.group_id)], 1
+                )
+    previous_image = getattr(instance, '_previous_image', None)
+    if instance.image.name != previous_image:
+        if previous_image:
+            storage.release(previous_image)
+        # Миниатюры уже загруженной раньше картинки создавать не нужно.
+        if instance.image and storage.retain(instance.image.name):
+            thumbnails.queue_thumbnails(instance.image)
+    caching.bump_post_feeds(
+        instance.author_id,
+        instance.group_id,
+        getattr(instance, '_previous_group_id', None),
+    )
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    deleting_posts().discard(instance.pk)
+    counters.change_user_stats(instance.author_id, post_count=-1)
+    counters.change_post_counts(
+        counters.post_scopes(instance.author_id, instance.group_id), -1
+    )
+    if instance.image:
+        storage.release(instance.image.name)
+    caching.bump_post_feeds(instance.author_id, instance.group_id)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comment_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    counters.change_comment_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def comment_changed(sender, instance, **kwargs):
+    if instance.post_id in deleting_posts():
+        return
+    if Comment.post.is_cached(instance):
+        post = instance.post
+    else:
+        post = Post.objects.filter(pk=instance.post_id).first()
+    if post is not None:
+        caching.bump_post_feeds(post.author_id, post.group_id)
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, raw, **kwargs):
+    # Нулевые счётчики сразу: профиль нового пользователя не должен
+    # ждать первого поста или подписки, чтобы показать числа.
+    if created and not raw:
+        UserStats.objects.bulk_create(
+            [UserStats(user=instance)], ignore_conflicts=True
+        )
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        timeline.backfill(instance.user_id, instance.author_id)
+        counters.change_user_stats(instance.user_id, following_count=1)
+        counters.change_user_stats(instance.author_id, follower_count=1)
+    caching.bump_feed_version(caching.PROFILE, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    counters.change_user_stats(instance.user_id, following_count=-1)
+    counters.change_user_stats(instance.author_id, follower_count=-1)
+    caching.bump_feed_version(caching.PROFILE, instance.author_id)
+
+
+@receiver(thumbnail_generated)
+def thumbnail_ready(sender, name, **kwargs):
+    # Закешированные страницы лент показывают исходную картинку.
+    for author_id, group_id in Post.objects.filter(image=name).values_list(
+        'author_id', 'group_id'
+    ):
+        caching.bump_post_feeds(author_id, group_id)
+
+
+@receiver(post_migrate)
+def search_triggers(sender, using, **kwargs):
+    if sender.name == 'posts':
+        search.install_triggers(connections[using])
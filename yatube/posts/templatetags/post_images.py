@@ -0,0 +1,69 @@
+import logging
+
+from django import template
+
+from core.thumbnails import note_deferred
+
+from ..images import average_color
+from ..thumbnails import PICTURES, SPECS, variant_name
+
+logger = logging.getLogger(__name__)
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, spec):
+    """Миниатюра картинки поста по имени из posts.thumbnails.SPECS.
+
+    Берётся из post.thumbnails, если её нашёл prefetch_thumbnails.
+    Как и тег thumbnail из sorl, при ошибке пишет её в лог и возвращает
+    None, чтобы не ломать страницу.
+    """
+    if not post.image:
+        return None
+    prefetched = getattr(post, 'thumbnails', {})
+    if spec in prefetched:
+        thumbnail = prefetched[spec]
+        if getattr(thumbnail, 'queued', False):
+            note_deferred(thumbnail)
+        return thumbnail
+    try:
+        return SPECS[spec].get(post.image)
+    except Exception:
+        logger.exception('Не удалось получить миниатюру %s', post.image)
+        return None
+
+
+@register.inclusion_tag('includes/post_picture.html')
+def post_picture(post, name):
+    """Картинка поста в <picture> по имени из posts.thumbnails.PICTURES.
+
+    Миниатюры каждого формата перечисляются в srcset по ширине, которая
+    известна заранее из PICTURES. Миниатюры из очереди пропускаются,
+    пока не будут созданы.
+    """
+    picture = PICTURES[name]
+    image = post_thumbnail(post, name)
+    srcsets = []
+    for format_ in picture.formats:
+        candidates = []
+        for width in picture.widths:
+            thumbnail = post_thumbnail(
+                post, variant_name(name, format_, width)
+            )
+            if thumbnail and not getattr(thumbnail, 'queued', False):
+                candidates.append(f'{thumbnail.url} {width}w')
+        srcsets.append((f'image/{format_.lower()}', ', '.join(candidates)))
+    return {
+        'post': post,
+        'image': image,
+        'sources': [source for source in srcsets[:-1] if source[1]],
+        'srcset': srcsets[-1][1],
+        'sizes': f'(max-width: {picture.width}px) 100vw, {picture.width}px',
+    }
+
+
+@register.filter
+def blurhash_color(hash_):
+    """Средний цвет картинки из BlurHash — фон, пока она не загрузилась."""
+    return average_color(hash_) if hash_ else ''
@@ -0,0 +1,291 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import MediaFile
+
+from .. import caching, search
+from ..management.commands import benchmark
+from ..management.commands.explain_feeds import Command as ExplainCommand
+from ..models import (
+    Comment,
+    Follow,
+    Group,
+    Post,
+    TimelineEntry,
+    User,
+    UserStats,
+)
+from ..thumbnails import SPECS
+
+TEXT = 'Тут какой-то текст:)'
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class RebuildTimelinesCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Post.objects.bulk_create(
+            Post(text=TEXT, author=cls.author) for _ in range(3)
+        )
+
+    def test_rebuild_restores_missing_entries(self):
+        """rebuild_timelines восстанавливает ленту по подпискам."""
+        self.assertEqual(self.reader.timeline.count(), 0)
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(
+            set(self.reader.timeline.values_list('post_id', flat=True)),
+            set(self.author.posts.values_list('id', flat=True)),
+        )
+
+    def test_rebuild_drops_stale_entries(self):
+        """rebuild_timelines удаляет записи без подписки."""
+        stranger = User.objects.create_user(username='stranger')
+        post = Post.objects.create(text=TEXT, author=stranger)
+        TimelineEntry.objects.create(
+            user=self.reader, post=post, pub_date=post.pub_date
+        )
+        call_command('rebuild_timelines', 'reader', stdout=StringIO())
+        self.assertFalse(self.reader.timeline.filter(post=post).exists())
+
+
+class RecountCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(text=TEXT, author=cls.author)
+        Comment.objects.create(post=cls.post, author=cls.reader, text=TEXT)
+
+    def test_recount_repairs_drift(self):
+        """recount исправляет разошедшиеся и создаёт недостающие счётчики."""
+        UserStats.objects.filter(user=self.author).update(
+            post_count=5, follower_count=0
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=self.post.pk).update(comment_count=7)
+        out = StringIO()
+        call_command('recount', '--batch-size', '1', stdout=out)
+        self.assertIn('пользователей 2, постов 1', out.getvalue())
+        author = UserStats.objects.get(user=self.author)
+        self.assertEqual((author.post_count, author.follower_count), (1, 1))
+        reader = UserStats.objects.get(user=self.reader)
+        self.assertEqual(reader.following_count, 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comment_count, 1)
+
+    def test_recount_media_refs(self):
+        """recount исправляет число ссылок на картинки."""
+        Post.objects.filter(pk=self.post.pk).update(image='posts/a.gif')
+        MediaFile.objects.create(name='posts/lost.gif', refs=3)
+        out = StringIO()
+        call_command('recount', stdout=out)
+        self.assertIn('картинок 2', out.getvalue())
+        self.assertEqual(
+            dict(MediaFile.objects.values_list('name', 'refs')),
+            {'posts/a.gif': 1, 'posts/lost.gif': 0},
+        )
+
+
+class SeedCommandTest(TestCase):
+    def seed(self, seed):
+        call_command(
+            'seed',
+            '--users=30',
+            '--groups=3',
+            '--posts=200',
+            '--comments=100',
+            '--follows=5',
+            f'--seed={seed}',
+            '--batch-size=64',
+            stdout=StringIO(),
+        )
+        first_user = User.objects.order_by('pk').first().pk
+        last_date = Post.objects.first().pub_date
+        # Даты отсчитываются от момента запуска, поэтому сравниваются
+        # относительно самого свежего поста.
+        return [
+            (text, author - first_user, (last_date - date).total_seconds())
+            for text, author, date in Post.objects.order_by('pk').values_list(
+                'text', 'author_id', 'pub_date'
+            )
+        ]
+
+    def clear(self):
+        User.objects.all().delete()
+        Group.objects.all().delete()
+
+    def test_seed_creates_consistent_data(self):
+        """seed создаёт данные, счётчики и ленты которых согласованы."""
+        self.seed(1)
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        author = UserStats.objects.order_by('-post_count').first()
+        self.assertEqual(author.post_count, author.user.posts.count())
+        self.assertEqual(author.follower_count, author.user.following.count())
+        reader = Follow.objects.first().user
+        self.assertEqual(
+            reader.timeline.count(),
+            Post.objects.filter(author__following__user=reader).count(),
+        )
+        post = Post.objects.first()
+        self.assertIn(post, search.filter_posts(Post.objects.all(), post.text))
+
+    def test_seed_is_deterministic(self):
+        """Одинаковый --seed даёт одинаковые данные."""
+        first = self.seed(1)
+        self.clear()
+        self.assertEqual(self.seed(1), first)
+        self.clear()
+        self.assertNotEqual(self.seed(2), first)
+
+
+class ExplainFeedsCommandTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='author')
+        cls.group = Group.objects.create(slug='slug')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.post = Post.objects.create(
+            text=TEXT, author=cls.author, group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.reader, text=TEXT)
+
+    def test_feed_queries_use_indexes(self):
+        """Запросы лент не читают таблицы целиком и не сортируют."""
+        out = StringIO()
+        call_command('explain_feeds', stdout=out, stderr=StringIO())
+        self.assertIn('post_group_date_idx', out.getvalue())
+
+    def test_full_scan_detection(self):
+        """Полный проход по таблице распознаётся, поиск по индексу — нет."""
+        self.assertTrue(ExplainCommand.is_full_scan('SCAN posts_post'))
+        self.assertTrue(ExplainCommand.is_full_scan('SCAN TABLE posts_post'))
+        self.assertFalse(
+            ExplainCommand.is_full_scan(
+                'SCAN posts_post USING INDEX post_date_idx'
+            )
+        )
+        self.assertFalse(ExplainCommand.is_full_scan('SCAN CONSTANT ROW'))
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_measure_reports_every_view(self):
+        """Замер даёт процентили, число запросов и память по страницам."""
+        call_command(
+            'seed',
+            '--users=20',
+            '--groups=2',
+            '--posts=50',
+            '--comments=20',
+            stdout=StringIO(),
+        )
+        results = benchmark.Command().measure(50, 2, cold=True)
+        self.assertEqual(
+            [row['view'] for row in results],
+            [
+                'index',
+                'group_posts',
+                'profile',
+                'post_detail',
+                'follow_index',
+                'post_create',
+                'add_comment',
+            ],
+        )
+        for row in results:
+            self.assertEqual(row['size'], 50)
+            self.assertLessEqual(row['p50_ms'], row['p99_ms'])
+            self.assertGreater(row['queries'], 0)
+            self.assertGreater(row['peak_memory_kb'], 0)
+
+    def test_percentile(self):
+        """Процентиль считается методом ближайшего ранга."""
+        values = list(range(1, 101))
+        self.assertEqual(benchmark.percentile(values, 50), 50)
+        self.assertEqual(benchmark.percentile(values, 95), 95)
+        self.assertEqual(benchmark.percentile([3, 1, 2], 99), 3)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class WarmThumbnailsCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_warm_creates_every_spec(self):
+        """warm_thumbnails создаёт все миниатюры картинок постов."""
+        author = User.objects.create_user(username='author')
+        post = Post.objects.create(
+            text=TEXT,
+            author=author,
+            image=SimpleUploadedFile('warm.gif', SMALL_GIF, 'image/gif'),
+        )
+        spec = SPECS['card']
+        # Пока миниатюры нет, вместо неё отдаётся исходная картинка.
+        self.assertEqual(spec.get(post.image).name, post.image.name)
+        version = caching.feed_version(caching.PROFILE, author.pk)
+        call_command('warm_thumbnails', '--processes=1', stdout=StringIO())
+        thumbnail = spec.get(post.image)
+        self.assertNotEqual(thumbnail.name, post.image.name)
+        self.assertTrue(thumbnail.exists())
+        # Ленты, показывавшие исходную картинку, сброшены.
+        self.assertNotEqual(
+            caching.feed_version(caching.PROFILE, author.pk), version
+        )
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class BackfillImageMetadataCommandTest(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_backfill_fills_readable_images(self):
+        """backfill_image_metadata заполняет сведения о картинках."""
+        author = User.objects.create_user(username='author')
+        image = SimpleUploadedFile('old.gif', SMALL_GIF, 'image/gif')
+        posts = [
+            Post.objects.create(text=TEXT, author=author, image=image)
+            for _ in range(3)
+        ]
+        lost = Post.objects.create(
+            text=TEXT, author=author, image='posts/lost.gif'
+        )
+        out = StringIO()
+        with self.assertLogs('posts.management', 'ERROR'):
+            call_command(
+                'backfill_image_metadata', '--batch-size=2', stdout=out
+            )
+        for post in posts:
+            post.refresh_from_db()
+            self.assertEqual((post.width, post.height), (2, 1))
+            self.assertEqual(post.byte_size, len(SMALL_GIF))
+            self.assertTrue(post.blurhash)
+        lost.refresh_from_db()
+        self.assertIsNone(lost.width)
+        self.assertIn('Обновлено постов: 3, пропущено постов', out.getvalue())
@@ -1,12 +1,21 @@
+import hashlib
+import json
+import os
 import shutil
 import tempfile
+from io import BytesIO
 
 from django.conf import settings
 from django.test import Client, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.urls import reverse
+from PIL import Image
 
+from core.models import Job, MediaFile
+
+from ..images import average_color
 from ..models import Comment, Group, Post, User
+from ..thumbnails import SPECS
 
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -35,6 +44,8 @@ class PostCreateFormTests(TestCase):
             b'\x02\x00\x01\x00\x00\x02\x02\x0C'
             b'\x0A\x00\x3B'
         )
+        digest = hashlib.sha256(cls.small_gif).hexdigest()
+        cls.small_gif_name = f'posts/{digest[:2]}/{digest}.gif'
 
     @classmethod
     def tearDownClass(cls):
@@ -67,7 +78,122 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group, self.group)
         self.assertEqual(post.author, self.user)
-        self.assertEqual(post.image.name, f'posts/{uploaded.name}')
+        self.assertEqual(post.image.name, self.small_gif_name)
+
+    def test_saved_image_thumbnails_queued(self):
+        """Миниатюры новой картинки ставятся в очередь при сохранении."""
+        uploaded = SimpleUploadedFile(
+            name='queued.gif', content=self.small_gif, content_type='image/gif'
+        )
+        self.authorized_client.post(
+            reverse('posts:create'), data={'text': TEXT, 'image': uploaded}
+        )
+        image = Post.objects.first().image.name
+        self.assertEqual(
+            [json.loads(job.args)[:2] for job in Job.objects.all()],
+            [[image, spec.geometry] for spec in SPECS.values()],
+        )
+        Job.objects.all().delete()
+        self.authorized_client.post(
+            reverse('posts:edit', args=(Post.objects.first().pk,)),
+            data={'text': ANOTHER_TEXT},
+        )
+        self.assertFalse(Job.objects.exists())
+
+    def test_duplicate_image_stored_once(self):
+        """Одинаковая картинка хранится и уменьшается один раз."""
+        url = reverse('posts:create')
+        for name in ('first.gif', 'second.gif'):
+            jobs = Job.objects.count()
+            uploaded = SimpleUploadedFile(
+                name=name, content=self.small_gif, content_type='image/gif'
+            )
+            self.authorized_client.post(
+                url, data={'text': TEXT, 'image': uploaded}
+            )
+        self.assertEqual(Job.objects.count(), jobs)
+        images = Post.objects.exclude(image='').values_list('image', flat=True)
+        self.assertEqual(set(images), {self.small_gif_name})
+        directory = os.path.dirname(Post.objects.first().image.path)
+        self.assertEqual(
+            os.listdir(directory), [os.path.basename(self.small_gif_name)]
+        )
+        media = MediaFile.objects.get(name=self.small_gif_name)
+        self.assertEqual(media.refs, 2)
+        Post.objects.first().delete()
+        media.refresh_from_db()
+        self.assertEqual(media.refs, 1)
+
+    def test_saved_image_metadata(self):
+        """Размеры, вес и BlurHash картинки записываются в пост."""
+        content = BytesIO()
+        Image.new('RGB', (40, 30), (0, 128, 255)).save(content, 'PNG')
+        uploaded = SimpleUploadedFile(
+            name='blue.png',
+            content=content.getvalue(),
+            content_type='image/png',
+        )
+        self.authorized_client.post(
+            reverse('posts:create'), data={'text': TEXT, 'image': uploaded}
+        )
+        post = Post.objects.first()
+        self.assertEqual((post.width, post.height), (40, 30))
+        self.assertEqual(post.byte_size, post.image.size)
+        self.assertEqual(average_color(post.blurhash), '#0080ff')
+        self.authorized_client.post(
+            reverse('posts:edit', args=(post.pk,)),
+            data={'text': TEXT, 'image-clear': 'on'},
+        )
+        post.refresh_from_db()
+        self.assertEqual(
+            (post.width, post.height, post.byte_size, post.blurhash),
+            (None, None, None, ''),
+        )
+
+    @override_settings(UPLOAD_IMAGE_MAX_SIZE=100)
+    def test_uploaded_photo_downsized_and_stripped(self):
+        """Большой снимок уменьшается, поворачивается и теряет EXIF."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой.
+        exif[0x010F] = 'Camera'
+        exif[0x8825] = {1: 'N'}  # GPSInfo: северная широта.
+        for format_, name in (('JPEG', 'photo.jpg'), ('PNG', 'photo.png')):
+            with self.subTest(format=format_):
+                content = BytesIO()
+                Image.new('RGB', (800, 400), (200, 30, 30)).save(
+                    content, format_, exif=exif
+                )
+                uploaded = SimpleUploadedFile(
+                    name=name,
+                    content=content.getvalue(),
+                    content_type=Image.MIME[format_],
+                )
+                self.authorized_client.post(
+                    reverse('posts:create'),
+                    data={'text': TEXT, 'image': uploaded},
+                )
+                post = Post.objects.first()
+                with Image.open(post.image.path) as image:
+                    self.assertEqual(image.format, format_)
+                    self.assertEqual(image.size, (50, 100))
+                    self.assertEqual(dict(image.getexif()), {})
+                self.assertEqual((post.width, post.height), (50, 100))
+
+    @override_settings(UPLOAD_MAX_BYTES=16)
+    def test_oversized_upload_rejected(self):
+        """Слишком большой файл не принимается, форма называет причину."""
+        posts_count = Post.objects.count()
+        uploaded = SimpleUploadedFile(
+            name='big.gif', content=self.small_gif, content_type='image/gif'
+        )
+        response = self.authorized_client.post(
+            reverse('posts:create'), data={'text': TEXT, 'image': uploaded}
+        )
+        self.assertEqual(Post.objects.count(), posts_count)
+        self.assertEqual(
+            response.context['form'].errors['image'],
+            ['Файл больше 16\xa0байт.'],
+        )
 
     def test_create_post_guess_client(self):
         """Невалидная форма не создает новый пост."""
@@ -118,7 +244,7 @@ class PostCreateFormTests(TestCase):
         self.assertEqual(post.text, form_data['text'])
         self.assertEqual(post.group, self.group)
         self.assertEqual(post.author, self.user)
-        self.assertEqual(post.image.name, f'posts/{uploaded.name}')
+        self.assertEqual(post.image.name, self.small_gif_name)
 
     def test_not_edit_post(self):
         """Невалидная форма не правит существующий пост"""
@@ -149,7 +275,7 @@ class PostCreateFormTests(TestCase):
 
         post = Post.objects.first()
         self.assertNotEqual(post.text, form_data['text'])
-        self.assertNotEqual(post.image.name, f'posts/{uploaded.name}')
+        self.assertNotEqual(post.image.name, self.small_gif_name)
 
     def test_authorized_user_can_leave_comments(self):
         """Авторизованный пользователь может оставлять комментарии"""
@@ -1,6 +1,19 @@
+from unittest import mock
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post, User, POST_TRUNCATE_NUMBER
+from .. import caching
+from ..models import (
+    Comment,
+    Follow,
+    Group,
+    Post,
+    User,
+    UserStats,
+    POST_TRUNCATE_NUMBER,
+)
 
 
 TITLE = 'Некоторая группа'
@@ -32,3 +45,74 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.author = User.objects.create_user(username='author')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_new_user_has_stats(self):
+        """У нового пользователя сразу есть нулевые счётчики."""
+        stats = self.stats(self.user)
+        self.assertEqual(
+            (stats.post_count, stats.follower_count, stats.following_count),
+            (0, 0, 0),
+        )
+
+    def test_post_count(self):
+        """Число постов автора меняется при создании и удалении поста."""
+        post = Post.objects.create(author=self.author, text=TEXT)
+        Post.objects.create(author=self.author, text=TEXT)
+        self.assertEqual(self.stats(self.author).post_count, 2)
+        post.delete()
+        self.assertEqual(self.stats(self.author).post_count, 1)
+
+    def test_follow_counts(self):
+        """Подписка меняет счётчики подписчиков и подписок."""
+        follow = Follow.objects.create(user=self.user, author=self.author)
+        self.assertEqual(self.stats(self.author).follower_count, 1)
+        self.assertEqual(self.stats(self.user).following_count, 1)
+        follow.delete()
+        self.assertEqual(self.stats(self.author).follower_count, 0)
+        self.assertEqual(self.stats(self.user).following_count, 0)
+
+    def test_comment_count_survives_stale_save(self):
+        """Сохранение загруженного ранее поста не затирает счётчик."""
+        post = Post.objects.create(author=self.author, text=TEXT)
+        comment = Comment.objects.create(
+            post=post, author=self.user, text=TEXT
+        )
+        post.text = 'Новый текст'
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comment_count, 0)
+
+    def test_post_delete_bumps_feeds_once(self):
+        """Каскадное удаление комментариев не сбрасывает ленты по разу."""
+        post = Post.objects.create(author=self.author, text=TEXT)
+        for _ in range(3):
+            Comment.objects.create(post=post, author=self.user, text=TEXT)
+        with mock.patch.object(caching, 'bump_post_feeds') as bump:
+            post.delete()
+        bump.assert_called_once_with(self.author.pk, None)
+
+    def test_post_delete_queries_do_not_grow_with_comments(self):
+        """Число запросов при удалении поста не зависит от комментариев."""
+        counts = []
+        for comments in (1, 10):
+            post = Post.objects.create(author=self.author, text=TEXT)
+            for _ in range(comments):
+                Comment.objects.create(post=post, author=self.user, text=TEXT)
+            with CaptureQueriesContext(connection) as queries:
+                post.delete()
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
@@ -25,6 +25,7 @@ class PostURLTests(TestCase):
             f'/group/{cls.group.slug}/': 'all',
             f'/profile/{cls.user.username}/': 'all',
             f'/posts/{cls.post.id}/': 'all',
+            f'/search/?q={TEXT}': 'all',
             '/create/': 'authorized',
             '/follow/': 'authorized',
             f'/posts/{cls.post.id}/edit/': 'author',
@@ -36,6 +37,7 @@ class PostURLTests(TestCase):
             f'/group/{cls.group.slug}/': 'posts/group_list.html',
             f'/profile/{cls.user.username}/': 'posts/profile.html',
             f'/posts/{cls.post.id}/': 'posts/post_detail.html',
+            f'/search/?q={TEXT}': 'posts/search.html',
             '/create/': 'posts/create.html',
             f'/posts/{cls.post.id}/edit/': 'posts/create.html',
             '/follow/': 'posts/follow.html',
@@ -1,11 +1,25 @@
-from django.test import Client, TestCase
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.test import Client, TestCase, override_settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils.http import urlencode
 from django import forms
+from PIL import Image
+
+from core.models import Job
 
-from ..models import User, Group, Post, Comment, Follow
+from .. import counters
+from ..cards import card_key
+from ..models import User, Group, Post, PostCount, Comment, Follow
+from ..paginators import CountedPaginator
 from ..consts import POSTS_NUMBERS
+from ..thumbnails import PICTURES
 
 
 USERNAME = 'author'
@@ -13,6 +27,7 @@ ANOTHER_USERNAME = 'another_author'
 SLUG = 'slug'
 ANOTHER_SLUG = 'another_slug'
 TEXT = 'Тут какой-то текст:)'
+NEW_TEXT = 'Тут новый текст'
 
 
 class PostPagesTests(TestCase):
@@ -70,6 +85,7 @@ class PostPagesTests(TestCase):
         }
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
 
@@ -167,7 +183,8 @@ class PostPagesTests(TestCase):
     def test_cache_index_page(self):
         """Проверка кеширования главной страницы"""
         response = self.authorized_client.get(self.url_address_map['index'])
-        self.post.delete()
+        # update() не отправляет сигналы, поэтому кеш не сбрасывается.
+        Post.objects.filter(pk=self.post.pk).update(text=NEW_TEXT)
         cached_response = self.authorized_client.get(
             self.url_address_map['index']
         )
@@ -178,6 +195,200 @@ class PostPagesTests(TestCase):
         )
         self.assertNotEqual(response.content, fresh_response.content)
 
+    def test_post_changes_reset_feed_caches(self):
+        """Изменение и удаление поста сразу видны на страницах лент"""
+        urls = [
+            self.url_address_map['index'],
+            self.url_address_map['group_list'],
+            self.url_address_map['profile'],
+        ]
+        for url in urls:
+            self.client.get(url)
+            self.authorized_client.get(url)
+        post = Post.objects.get(pk=self.post.pk)
+        post.text = NEW_TEXT
+        post.save()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), NEW_TEXT)
+                self.assertContains(self.authorized_client.get(url), NEW_TEXT)
+        post.delete()
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertNotContains(self.client.get(url), NEW_TEXT)
+
+    def test_moving_post_resets_previous_group_cache(self):
+        """Перенос поста в другую группу сбрасывает кеш прежней группы"""
+        self.client.get(self.url_address_map['group_list'])
+        post = Post.objects.get(pk=self.post.pk)
+        post.group = self.another_group
+        post.save()
+        response = self.client.get(self.url_address_map['group_list'])
+        self.assertEqual(len(response.context['page_obj']), 0)
+        self.assertNotContains(response, TEXT)
+
+    def test_card_not_cached_while_thumbnail_queued(self):
+        """Пока миниатюра в очереди, карточка показывает исходную
+        картинку и не кешируется"""
+        post = Post.objects.get(pk=self.post.pk)
+        key = card_key(post, show_group_link=True)
+        response = self.client.get(self.url_address_map['index'])
+        self.assertContains(response, post.image.url)
+        self.assertIsNone(cache.get(key))
+        self.assertTrue(
+            Job.objects.filter(name__endswith='generate_thumbnail').exists()
+        )
+        # Созданная миниатюра сбрасывает закешированные страницы лент.
+        call_command('runworker', '--burst', '--threads=1', stdout=StringIO())
+        response = self.client.get(self.url_address_map['index'])
+        self.assertNotContains(response, post.image.url)
+        self.assertIsNotNone(cache.get(key))
+
+    def test_page_thumbnails_read_in_one_query(self):
+        """Миниатюры всех карточек страницы читаются одним запросом"""
+        with self.post.image.open() as image:
+            content = image.read()
+        for number in range(3):
+            Post.objects.create(
+                text=TEXT,
+                author=self.user,
+                image=SimpleUploadedFile(f'{number}.gif', content),
+            )
+        self.client.get(self.url_address_map['index'])
+        call_command('runworker', '--burst', '--threads=1', stdout=StringIO())
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url_address_map['index'])
+        kvstore_queries = [
+            query
+            for query in queries.captured_queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        self.assertContains(response, 'width="960" height="339"', count=4)
+
+    def test_queued_thumbnails_not_enqueued_again(self):
+        """Страница с ожидающими миниатюрами не пишет в очередь"""
+        self.client.get(self.url_address_map['index'])
+        jobs = Job.objects.count()
+        self.assertGreater(jobs, 0)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url_address_map['index'])
+        self.assertFalse(
+            any(
+                query['sql'].startswith('INSERT INTO "core_job"')
+                for query in queries.captured_queries
+            )
+        )
+        self.assertEqual(Job.objects.count(), jobs)
+
+    def test_unchanged_pages_not_modified(self):
+        """Неизменённые страницы отдают 304 после одного запроса к базе"""
+        for name in ('group_list', 'profile', 'post_detail'):
+            with self.subTest(page=name):
+                url = self.url_address_map[name]
+                response = self.client.get(url)
+                self.assertFalse(response.has_header('Last-Modified'))
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(
+                        url, HTTP_IF_NONE_MATCH=response['ETag']
+                    )
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(len(queries), 1)
+
+    def test_changed_pages_modified(self):
+        """После изменений и для другого пользователя ETag меняется"""
+        urls = [
+            self.url_address_map[name]
+            for name in ('group_list', 'profile', 'post_detail')
+        ]
+        etags = [self.client.get(url)['ETag'] for url in urls]
+        for url, etag in zip(urls, etags):
+            response = self.authorized_client.get(
+                url, HTTP_IF_NONE_MATCH=etag
+            )
+            self.assertEqual(response.status_code, 200)
+        reader = User.objects.create_user(username='reader')
+        other_post = Post.objects.create(
+            text=TEXT, author=self.user, group=self.group
+        )
+        comment = Comment.objects.create(
+            post=self.post, author=self.user, text=TEXT
+        )
+        # Подписки видны только в профиле.
+        for change, changed_urls in (
+            (comment.delete, urls),
+            (other_post.delete, urls),
+            (
+                lambda: Follow.objects.create(user=reader, author=self.user),
+                urls[1:2],
+            ),
+            (lambda: Follow.objects.filter(user=reader).delete(), urls[1:2]),
+        ):
+            etags = [self.client.get(url)['ETag'] for url in changed_urls]
+            change()
+            for url, etag in zip(changed_urls, etags):
+                with self.subTest(url=url, change=change):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since_ignored(self):
+        """Без ETag запрос с If-Modified-Since получает страницу"""
+        for name in ('group_list', 'profile', 'post_detail'):
+            with self.subTest(page=name):
+                response = self.client.get(
+                    self.url_address_map[name],
+                    HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT',
+                )
+                self.assertEqual(response.status_code, 200)
+
+    def test_picture_lists_every_width(self):
+        """Готовые миниатюры всех размеров попадают в srcset"""
+        self.client.get(self.url_address_map['index'])
+        call_command('runworker', '--burst', '--threads=1', stdout=StringIO())
+        cache.clear()
+        response = self.client.get(self.url_address_map['index'])
+        picture = PICTURES['card']
+        for format_, width, spec in picture.variants():
+            url = spec.get(self.post.image).url
+            self.assertContains(response, f'{url} {width}w')
+        self.assertContains(
+            response, f'sizes="(max-width: {picture.width}px) 100vw'
+        )
+
+    def test_queued_image_uses_stored_dimensions(self):
+        """Пока миниатюры нет, размеры картинки берутся из поста"""
+        Post.objects.filter(pk=self.post.pk).update(
+            width=2, height=1, blurhash='00TI:j'
+        )
+        cache.clear()
+        response = self.client.get(self.url_address_map['index'])
+        self.assertContains(
+            response,
+            f'src="{self.post.image.url}" loading="lazy" width="2" '
+            'height="1" data-blurhash="00TI:j" '
+            'style="background-color: #ff0000"',
+        )
+
+    def test_post_card_cached_until_post_changes(self):
+        """Карточка поста берётся из кеша, пока пост не изменён"""
+        self.client.get(self.url_address_map['index'])
+        call_command('runworker', '--burst', '--threads=1', stdout=StringIO())
+        cache.clear()
+        self.client.get(self.url_address_map['index'])
+        post = Post.objects.get(pk=self.post.pk)
+        key = card_key(post, show_group_link=True)
+        self.assertIn(TEXT, cache.get(key))
+        cache.set(key, 'CACHED_CARD')
+        response = self.client.get(self.url_address_map['profile'])
+        self.assertContains(response, 'CACHED_CARD')
+        post.text = NEW_TEXT
+        post.save()
+        response = self.client.get(self.url_address_map['profile'])
+        self.assertNotContains(response, 'CACHED_CARD')
+        self.assertContains(response, NEW_TEXT)
+
     def test_authorized_client_can_follow_another_authors(self):
         """Проверка что авторизованный пользователь может подписываться
         на других пользователей и удалять их из подписок"""
@@ -213,6 +424,20 @@ class PostPagesTests(TestCase):
         )
         self.assertEqual(len(response.context['page_obj']), 0)
 
+    def test_unfollow_removes_posts_from_follow_index(self):
+        """После отписки посты автора пропадают из ленты подписок"""
+        Post.objects.create(text=TEXT, author=self.another_user)
+        self.authorized_client.get(self.url_address_map['follow'])
+        response = self.authorized_client.get(
+            self.url_address_map['follow_index']
+        )
+        self.assertEqual(len(response.context['page_obj']), 1)
+        self.authorized_client.get(self.url_address_map['unfollow'])
+        response = self.authorized_client.get(
+            self.url_address_map['follow_index']
+        )
+        self.assertEqual(len(response.context['page_obj']), 0)
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -253,3 +478,317 @@ class PaginatorViewsTest(TestCase):
             self.assertEqual(
                 len(response.context['page_obj']), self.SECOND_PAGE_COUNT
             )
+
+    def test_cursor_pages_contain_correct_records(self):
+        """Проверка курсорной навигации вперёд и назад"""
+
+        for url_address in self.url_address_lst:
+            with self.subTest(url_address=url_address):
+                response = self.client.get(url_address)
+                first_page = response.context['page_obj']
+                paginator = first_page.paginator
+                self.assertEqual(len(first_page), POSTS_NUMBERS)
+                self.assertTrue(paginator.has_next)
+                self.assertFalse(paginator.has_previous)
+
+                response = self.client.get(
+                    url_address, {'after': paginator.next_cursor}
+                )
+                second_page = response.context['page_obj']
+                paginator = second_page.paginator
+                self.assertEqual(len(second_page), self.SECOND_PAGE_COUNT)
+                self.assertFalse(paginator.has_next)
+                self.assertTrue(paginator.has_previous)
+
+                response = self.client.get(
+                    url_address, {'before': paginator.previous_cursor}
+                )
+                self.assertEqual(
+                    list(response.context['page_obj']), list(first_page)
+                )
+
+    def test_cursor_page_makes_no_count_query(self):
+        """Курсорная страница не выполняет COUNT(*)"""
+
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url_address_lst[1])
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_numbered_pages_use_stored_count(self):
+        """Номерные страницы берут число постов из PostCount"""
+        self.client.get(self.url_address_lst[1], {'page': 2})
+        scope = counters.group_scope(self.group.pk)
+        self.assertEqual(
+            PostCount.objects.get(scope=scope).count,
+            POSTS_NUMBERS + self.SECOND_PAGE_COUNT,
+        )
+        Post.objects.create(text=TEXT, author=self.user, group=self.group)
+        paginator = CountedPaginator(
+            Post.objects.all(), POSTS_NUMBERS, scope=scope
+        )
+        with CaptureQueriesContext(connection) as queries:
+            count = paginator.count
+        self.assertEqual(count, POSTS_NUMBERS + self.SECOND_PAGE_COUNT + 1)
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_missing_count_is_estimated(self):
+        """Без счётчика берётся оценка по статистике и ставится пересчёт"""
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        paginator = CountedPaginator(
+            Post.objects.all(), POSTS_NUMBERS, scope=counters.ALL
+        )
+        with mock.patch.object(counters, 'refresh_later') as refresh_later:
+            self.assertEqual(
+                paginator.count, POSTS_NUMBERS + self.SECOND_PAGE_COUNT
+            )
+        refresh_later.assert_called_once_with(counters.ALL)
+        self.assertFalse(PostCount.objects.exists())
+
+    def test_group_and_author_counts_are_exact(self):
+        """Ленты групп и авторов не оцениваются средним по индексу"""
+        other = User.objects.create_user(username=ANOTHER_USERNAME)
+        Post.objects.create(text=TEXT, author=other)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        for scope in (
+            counters.group_scope(self.group.pk),
+            counters.author_scope(self.user.pk),
+        ):
+            with self.subTest(scope=scope):
+                paginator = CountedPaginator(
+                    Post.objects.all(), POSTS_NUMBERS, scope=scope
+                )
+                self.assertEqual(
+                    paginator.count, POSTS_NUMBERS + self.SECOND_PAGE_COUNT
+                )
+                self.assertTrue(PostCount.objects.filter(scope=scope).exists())
+
+    def test_pending_refresh_not_enqueued_again(self):
+        """Пока пересчёт в очереди, запросы не пытаются поставить его снова"""
+        counters.refresh_later(counters.ALL)
+        with CaptureQueriesContext(connection) as queries:
+            counters.refresh_later(counters.ALL)
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+
+@override_settings(QUERY_BUDGET_RAISE=True)
+class QueryCountTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.group = Group.objects.create(slug=SLUG)
+        cls.post = Post.objects.create(
+            text=TEXT, author=cls.user, group=cls.group
+        )
+        Comment.objects.create(post=cls.post, author=cls.user, text=TEXT)
+        cls.urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': cls.user.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.id}),
+        ]
+
+    def count_queries(self, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_posts(self):
+        """Число запросов не зависит от количества постов и комментариев"""
+        before = [self.count_queries(url) for url in self.urls]
+        other = User.objects.create_user(username=ANOTHER_USERNAME)
+        for _ in range(POSTS_NUMBERS):
+            Post.objects.create(text=TEXT, author=other, group=self.group)
+            Post.objects.create(text=TEXT, author=self.user)
+            Comment.objects.create(post=self.post, author=other, text=TEXT)
+        after = [self.count_queries(url) for url in self.urls]
+        self.assertEqual(before, after)
+
+    def image(self, number):
+        buffer = BytesIO()
+        Image.new('RGB', (20, 10), (number, 0, 0)).save(buffer, 'PNG')
+        return SimpleUploadedFile(f'{number}.png', buffer.getvalue())
+
+    def test_pages_within_query_budget(self):
+        """Страницы с картинками, подписками и пагинацией укладываются
+        в бюджет запросов, в том числе с холодным кешем"""
+        reader = User.objects.create_user(username=ANOTHER_USERNAME)
+        other = User.objects.create_user(username='other')
+        Follow.objects.create(user=reader, author=self.user)
+        for number in range(POSTS_NUMBERS + 1):
+            post = Post.objects.create(
+                text=TEXT,
+                author=self.user,
+                group=self.group,
+                image=self.image(number),
+            )
+        client = Client()
+        client.force_login(reader)
+        pages = (
+            self.urls
+            + [f'{url}?page=2' for url in self.urls[:3]]
+            + [
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+                reverse('posts:follow_index'),
+                f"{reverse('posts:search')}?{urlencode({'q': 'текст'})}",
+            ]
+        )
+        for url in pages:
+            cache.clear()
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 200)
+        client.force_login(self.user)
+        edit = reverse('posts:edit', kwargs={'post_id': self.post.pk})
+        actions = [
+            (
+                reverse('posts:create'),
+                {
+                    'text': TEXT,
+                    'group': self.group.pk,
+                    'image': self.image(50),
+                },
+            ),
+            (edit, {'text': TEXT, 'image': self.image(60)}),
+            (edit, {'text': TEXT, 'image': self.image(70)}),
+            (
+                reverse('posts:add_comment', kwargs={'post_id': self.post.pk}),
+                {'text': TEXT},
+            ),
+            (reverse('posts:profile_follow', args=(other.username,)), None),
+            (reverse('posts:profile_unfollow', args=(other.username,)), None),
+        ]
+        for url, data in actions:
+            with self.subTest(url=url):
+                if data is None:
+                    response = client.get(url)
+                else:
+                    response = client.post(url, data)
+                self.assertEqual(response.status_code, 302)
+
+
+class IndexCacheTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.another_user = User.objects.create_user(username=ANOTHER_USERNAME)
+        cls.post = Post.objects.create(text=TEXT, author=cls.user)
+        cls.index_url = reverse('posts:index')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_anonymous_clients_share_cached_page(self):
+        """Анонимы с разными cookie получают одну закешированную страницу"""
+        first_client = Client()
+        first_client.cookies['sessionid'] = 'first'
+        second_client = Client()
+        second_client.cookies['sessionid'] = 'second'
+
+        response = first_client.get(self.index_url)
+        Post.objects.filter(pk=self.post.pk).update(text=NEW_TEXT)
+        cached_response = second_client.get(self.index_url)
+        self.assertEqual(response.content, cached_response.content)
+
+    def test_authorized_users_share_post_list_fragment(self):
+        """Авторизованные получают общий список постов и свою шапку"""
+        first_client = Client()
+        first_client.force_login(self.user)
+        second_client = Client()
+        second_client.force_login(self.another_user)
+
+        first_client.get(self.index_url)
+        Post.objects.filter(pk=self.post.pk).update(text=NEW_TEXT)
+        response = second_client.get(self.index_url)
+        self.assertContains(response, TEXT)
+        self.assertNotContains(response, NEW_TEXT)
+        self.assertContains(response, f'Пользователь: {ANOTHER_USERNAME}')
+
+
+class SearchTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username=USERNAME)
+        cls.best = Post.objects.create(
+            text='Ежик, ежик, ежик в тумане', author=cls.user
+        )
+        cls.other = Post.objects.create(
+            text='Туман над рекой и один ежик', author=cls.user
+        )
+        cls.commented = Post.objects.create(text=TEXT, author=cls.user)
+        Comment.objects.create(
+            post=cls.commented, author=cls.user, text='Видел ежика'
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост про ежей номер {i}', author=cls.user)
+            for i in range(POSTS_NUMBERS)
+        )
+
+    def search(self, query, **params):
+        return self.client.get(reverse('posts:search'), {'q': query, **params})
+
+    def test_results_ranked(self):
+        """Результаты упорядочены по релевантности"""
+        response = self.search('ежик')
+        self.assertEqual(
+            list(response.context['page_obj']),
+            [self.best, self.other, self.commented],
+        )
+
+    def test_words_match_by_prefix_and_all_required(self):
+        """Слова ищутся по началу, все слова обязательны"""
+        response = self.search('туман еж')
+        self.assertEqual(
+            set(response.context['page_obj']), {self.best, self.other}
+        )
+
+    def test_index_follows_changes(self):
+        """Индекс следует за изменением и удалением текста"""
+        Post.objects.filter(pk=self.other.pk).update(text='Про реку')
+        self.assertNotIn(self.other, self.search('ежик').context['page_obj'])
+        Post.objects.filter(pk=self.best.pk).delete()
+        self.assertNotIn(self.best, self.search('ежик').context['page_obj'])
+
+    def test_pagination_keeps_query(self):
+        """Результаты разбиты на страницы, ссылки сохраняют запрос"""
+        response = self.search('еж')
+        self.assertEqual(
+            response.context['page_obj'].paginator.count, POSTS_NUMBERS + 3
+        )
+        self.assertContains(response, '?q=%D0%B5%D0%B6&amp;page=2')
+        response = self.search('еж', page=2)
+        self.assertEqual(len(response.context['page_obj']), 3)
+
+    def test_syntax_is_not_interpreted(self):
+        """Операторы FTS5 во вводе не вызывают ошибок"""
+        for query in ('"', 'ежик OR', 'NEAR(', '*', ''):
+            with self.subTest(query=query):
+                self.assertEqual(self.search(query).status_code, 200)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт по полнотекстовому индексу"""
+        admin = User.objects.create_superuser('admin', 'admin@ya.ru', 'pass')
+        self.client.force_login(admin)
+        for url, count in (
+            ('admin:posts_post_changelist', 2),
+            ('admin:posts_comment_changelist', 1),
+        ):
+            with self.subTest(url=url):
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(reverse(url), {'q': 'ежик'})
+                self.assertEqual(response.context['cl'].result_count, count)
+                self.assertFalse(
+                    any(
+                        'LIKE' in query['sql']
+                        for query in queries.captured_queries
+                    )
+                )
@@ -0,0 +1,66 @@
+from core import thumbnails
+from core.thumbnails import PictureSpec, lookup_thumbnails, supported_formats
+
+# Картинки постов в разных размерах и форматах для тега post_picture.
+# AVIF и WebP используются, только если их поддерживает сборка Pillow;
+# JPEG — запасной формат для браузеров без них.
+PICTURES = {
+    'card': PictureSpec(
+        960,
+        339,
+        widths=(480, 960, 1440),
+        formats=supported_formats(('AVIF', 'WEBP')) + ('JPEG',),
+        options={'crop': 'center', 'upscale': True},
+    ),
+}
+
+
+def variant_name(name, format_, width):
+    """Имя миниатюры картинки PICTURES[name] в SPECS.
+
+    Основная миниатюра (запасной формат, основная ширина) называется
+    так же, как сама картинка.
+    """
+    picture = PICTURES[name]
+    if (format_, width) == (picture.formats[-1], picture.width):
+        return name
+    return f'{name}-{width}-{format_.lower()}'
+
+
+# Миниатюры картинок постов. Шаблоны получают их тегами post_thumbnail
+# и post_picture, а создаются они заранее: при сохранении картинки
+# (signals.py) и командой warm_thumbnails.
+SPECS = {
+    variant_name(name, format_, width): spec
+    for name, picture in PICTURES.items()
+    for format_, width, spec in picture.variants()
+}
+
+
+# Приоритет задач остальных размеров и форматов: основная миниатюра
+# нужна раньше, до неё карточка показывает исходную картинку.
+VARIANT_PRIORITY = 5
+
+
+def queue_thumbnails(image):
+    """Ставит в очередь все миниатюры картинки одним запросом."""
+    thumbnails.queue_thumbnails(
+        (image, spec, None if name in PICTURES else VARIANT_PRIORITY)
+        for name, spec in SPECS.items()
+    )
+
+
+def prefetch_thumbnails(posts):
+    """Кладёт в post.thumbnails миниатюры всех SPECS картинок постов.
+
+    Все миниатюры страницы находятся одним обращением к кешу и базе,
+    поэтому шаблон карточек не обращается к kvstore и хранилищу.
+    """
+    posts = [post for post in posts if post.image]
+    thumbnails = iter(
+        lookup_thumbnails(
+            [(post.image, spec) for post in posts for spec in SPECS.values()]
+        )
+    )
+    for post in posts:
+        post.thumbnails = {name: next(thumbnails) for name in SPECS}
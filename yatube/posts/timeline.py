@@ -0,0 +1,66 @@
+from django.db import connection
+from django.db.models import DateTimeField, IntegerField, Value
+
+from .models import Follow, Post, TimelineEntry
+
+
+def _insert(queryset, columns):
+    """Переносит строки выборки в ленты одной командой INSERT ... SELECT.
+
+    columns — столбцы posts_timelineentry в порядке столбцов выборки.
+    """
+    sql, params = queryset.query.sql_with_params()
+    table = connection.ops.quote_name(TimelineEntry._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(name) for name in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({columns}) {sql}', params)
+
+
+def _posts_for(user_id, posts):
+    """Посты, которых ещё нет в ленте пользователя, с его id."""
+    return (
+        posts.exclude(timeline_entries__user_id=user_id)
+        .annotate(reader=Value(user_id, output_field=IntegerField()))
+        .order_by()
+        .values_list('id', 'pub_date', 'reader')
+    )
+
+
+def fan_out(post):
+    """Раскладывает новый пост по лентам всех подписчиков автора."""
+    followers = (
+        Follow.objects.filter(author_id=post.author_id)
+        .annotate(
+            timeline_post=Value(post.pk, output_field=IntegerField()),
+            timeline_date=Value(post.pub_date, output_field=DateTimeField()),
+        )
+        .values_list('user_id', 'timeline_post', 'timeline_date')
+    )
+    _insert(followers, ('user_id', 'post_id', 'pub_date'))
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту пользователя все посты автора."""
+    posts = _posts_for(user_id, Post.objects.filter(author_id=author_id))
+    _insert(posts, ('post_id', 'pub_date', 'user_id'))
+
+
+def prune(user_id, author_id):
+    """Убирает из ленты пользователя посты автора."""
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def rebuild(user_id):
+    """Пересобирает ленту пользователя по его текущим подпискам."""
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    posts = Post.objects.filter(author__following__user_id=user_id)
+    _insert(_posts_for(user_id, posts), ('post_id', 'pub_date', 'user_id'))
+
+
+def feed(user):
+    """Лента подписок: записи timeline вместе с постами."""
+    return TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group'
+    )
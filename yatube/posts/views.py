@@ -1,60 +1,124 @@
-from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.cache import cache_page
-from django.views.decorators.vary import vary_on_cookie
+from django.core.paginator import Paginator
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import urlencode
+
+from core.decorators import anonymous_cache_page, conditional, query_budget
 
+from . import caching, counters, search, timeline
+from .cards import attach_cards
 from .forms import PostForm, CommentForm
 from .models import Follow, Group, Post, User
-from .consts import POSTS_NUMBERS
+from .consts import FEED_CACHE_TIMEOUT, POSTS_NUMBERS
+from .paginators import page_key, paginate
 
 
-@cache_page(20, key_prefix='index_page')
-@vary_on_cookie
-def index(request):
-    post_list = Post.objects.all()
-    paginator = Paginator(post_list, POSTS_NUMBERS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {
-        'page_obj': page_obj,
+def feed_page(request, post_list, count_scope, show_group_link=True):
+    page_obj = paginate(request, post_list, count_scope=count_scope)
+    page_obj.object_list = attach_cards(
+        list(page_obj.object_list), show_group_link
+    )
+    return page_obj
+
+
+def feed_context(
+    request, post_list, version, count_scope, show_group_link=True
+):
+    # Список постов берётся из кеша фрагмента шаблона, поэтому страница
+    # вычисляется, только если фрагмента в кеше нет.
+    return {
+        'page_obj': SimpleLazyObject(
+            lambda: feed_page(
+                request, post_list, count_scope, show_group_link
+            )
+        ),
+        'page_key': page_key(request),
+        'feed_version': version,
+        'cache_timeout': FEED_CACHE_TIMEOUT,
     }
+
+
+@anonymous_cache_page(
+    FEED_CACHE_TIMEOUT,
+    'index_page',
+    vary_on=caching.index_vary_on,
+    version=caching.index_version,
+)
+@query_budget(8)
+def index(request):
+    post_list = Post.objects.select_related('author', 'group')
+    context = feed_context(
+        request,
+        post_list,
+        caching.feed_version(caching.INDEX),
+        counters.ALL,
+    )
     return render(request, 'posts/index.html', context)
 
 
+@conditional(caching.group_state)
+@query_budget(8)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = Post.objects.filter(group=group).all()
-    paginator = Paginator(post_list, POSTS_NUMBERS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    context = {
-        'group': group,
-        'page_obj': page_obj,
-    }
+    post_list = group.posts.select_related('author')
+    context = feed_context(
+        request,
+        post_list,
+        caching.feed_version(caching.GROUP, group.pk),
+        counters.group_scope(group.pk),
+        show_group_link=False,
+    )
+    context['group'] = group
     return render(request, 'posts/group_list.html', context)
 
 
+@conditional(caching.profile_state)
+@query_budget(9)
 def profile(request, username):
-    author = User.objects.get(username=username)
-    post_list = Post.objects.filter(author=author)
-    paginator = Paginator(post_list, POSTS_NUMBERS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username
+    )
+    post_list = author.posts.select_related('group')
     following = (
         request.user.is_authenticated
         and Follow.objects.filter(user=request.user, author=author).exists()
     )
-    context = {'page_obj': page_obj, 'author': author, 'following': following}
+    context = feed_context(
+        request,
+        post_list,
+        caching.feed_version(caching.PROFILE, author.pk),
+        counters.author_scope(author.pk),
+    )
+    context.update(author=author, following=following)
     return render(request, 'posts/profile.html', context)
 
 
+@query_budget(5)
+def search_posts(request):
+    query = request.GET.get('q', '').strip()
+    paginator = Paginator(search.SearchResults(query), POSTS_NUMBERS)
+    page_obj = paginator.get_page(request.GET.get('page'))
+    page_obj.object_list = attach_cards(page_obj.object_list)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        # Приставка к ссылкам пагинатора, чтобы не терять запрос.
+        'page_query': urlencode({'q': query}) + '&',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional(caching.post_state)
+@query_budget(2)
 def post_detail(request, post_id):
     form = CommentForm()
-    post = Post.objects.get(id=post_id)
-    comments = post.comments.all()
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'), pk=post_id
+    )
+    comments = post.comments.select_related('author')
     context = {
         'post': post,
         'is_edit': True,
@@ -65,6 +129,7 @@ def post_detail(request, post_id):
 
 
 @login_required()
+@query_budget(11)
 def post_create(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
     if not form.is_valid():
@@ -78,9 +143,10 @@ def post_create(request):
 
 
 @login_required()
+@query_budget(11)
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
-    if post.author != request.user:
+    if post.author_id != request.user.id:
         return redirect('posts:post_detail', post_id=post_id)
 
     form = PostForm(
@@ -98,6 +164,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@query_budget(3)
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -110,18 +177,19 @@ def add_comment(request, post_id):
 
 
 @login_required
+@query_budget(3)
 def follow_index(request):
-    post_list = Post.objects.filter(
-        author__following__user=request.user
-    ).select_related('author', 'group')
-    paginator = Paginator(post_list, POSTS_NUMBERS)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    entries = timeline.feed(request.user)
+    page_obj = paginate(request, entries, key=('pub_date', 'post_id'))
+    page_obj.object_list = attach_cards(
+        [entry.post for entry in page_obj.object_list]
+    )
     context = {'page_obj': page_obj}
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
+@query_budget(6)
 def profile_follow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -134,6 +202,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@query_budget(7)
 def profile_unfollow(request, username):
     user = request.user
     author = get_object_or_404(User, username=username)
@@ -10,7 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
+import atexit
 import os
+import shutil
+import sys
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -52,6 +56,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.TimingMiddleware',
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -148,10 +154,66 @@ CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 # Static files (CSS, JavaScript, Images)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Загрузки называются по хешу содержимого, одинаковые хранятся один раз.
+# Миниатюры — обычные файлы: их имена вычисляет sorl-thumbnail.
+DEFAULT_FILE_STORAGE = 'core.storage.ContentAddressedStorage'
+THUMBNAIL_STORAGE = 'django.core.files.storage.FileSystemStorage'
+# Загрузки принимаются потоком (core.uploads.ImageUploadHandler): файлы
+# больше UPLOAD_MAX_BYTES отвергаются, картинки уменьшаются до
+# UPLOAD_IMAGE_MAX_SIZE по большей стороне и теряют EXIF. Картинки,
+# которые и после уменьшения при декодировании JPEG больше
+# UPLOAD_IMAGE_MAX_PIXELS, не принимаются.
+FILE_UPLOAD_HANDLERS = ['core.uploads.ImageUploadHandler']
+UPLOAD_MAX_BYTES = 20 * 1024 * 1024
+UPLOAD_IMAGE_MAX_SIZE = 2560
+UPLOAD_IMAGE_MAX_PIXELS = 40 * 10 ** 6
 
 # enabling caching
+# Кеш в файле SQLite общий для всех воркеров на сервере.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_BYTES': 64 * 1024 * 1024,
+        },
     }
 }
+
+# Превышение бюджета SQL-запросов представления (core.decorators.query_budget)
+# пишется в лог; True превращает его в исключение QueryBudgetExceeded.
+QUERY_BUDGET_RAISE = False
+
+# Доля запросов сотрудников, которые core.middleware.TimingMiddleware
+# выполняет под cProfile (0 — только запросы с параметром ?profile),
+# и каталог для файлов .prof.
+PROFILE_SAMPLE_RATE = 0
+PROFILE_DIR = os.path.join(BASE_DIR, 'profiles')
+
+# Метрики всех воркеров сервера собираются в одном файле SQLite и
+# отдаются по /metrics с заголовком Authorization: Bearer METRICS_TOKEN.
+# Без токена /metrics закрыт. METRICS_ALLOWED_IPS — адреса, которым токен
+# не нужен; loopback сюда добавлять нельзя, если перед сервером стоит
+# прокси на той же машине.
+METRICS_DB = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = ()
+
+# Миниатюры создаются фоновыми задачами (manage.py runworker), а до
+# этого вместо них показываются исходные картинки.
+THUMBNAIL_BACKEND = 'core.thumbnails.QueuedThumbnailBackend'
+THUMBNAIL_QUEUED = True
+
+# Тесты (manage.py test и pytest) работают со своими кешем, метриками и
+# загрузками во временном каталоге: cache.clear() в них не должен
+# сбрасывать кеш сервера, а счётчики — попадать в его /metrics.
+TESTING = sys.argv[1:2] == ['test'] or 'pytest' in sys.modules
+if TESTING:
+    TEST_DIR = tempfile.mkdtemp(prefix='yatube-test-')
+    atexit.register(shutil.rmtree, TEST_DIR, ignore_errors=True)
+    CACHES['default']['LOCATION'] = os.path.join(TEST_DIR, 'cache.sqlite3')
+    METRICS_DB = os.path.join(TEST_DIR, 'metrics.sqlite3')
+    MEDIA_ROOT = os.path.join(TEST_DIR, 'media')
+    PROFILE_DIR = os.path.join(TEST_DIR, 'profiles')
+    # Тесты представлений проверяют и их бюджеты SQL-запросов.
+    QUERY_BUDGET_RAISE = True